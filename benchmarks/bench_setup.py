@@ -0,0 +1,382 @@
+#!/usr/bin/python
+"""
+Time the control-plane setup of a network (topology, switches and links,
+neighbor tables, routes and Click configs) as it grows, without root or a
+running Mininet: the nodes, interfaces and links are lightweight stand-ins,
+and the switches are ClickUserSwitches that never start a shell. Only the
+mininet package has to be importable.
+
+Every combination of --num_routers, --nodes_per_router and --sparsity is
+built --repeat times, and each stage's time and peak memory is appended to
+--output. Tracing allocations slows them down, so each repeat builds the same
+network twice: once timed, once with its memory traced. With --baseline,
+stages that got more than --tolerance times slower than in an earlier output
+are reported and the exit status is 1.
+
+$ python benchmarks/bench_setup.py --topology random --num_routers 8 16 32
+"""
+import argparse
+import collections
+import itertools
+import os
+import os.path
+import resource
+import sys
+import time
+
+os.chdir(os.path.abspath(os.path.dirname(sys.argv[0])))
+# Ahead of site-packages, which may have an unrelated "click".
+sys.path.insert(0, "..")
+
+import numpy as np
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+import click
+import routing
+import runner
+import start
+import topology
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--topology",
+        default="random",
+        choices=topology.TOPOLOGIES,
+    )
+    parser.add_argument("--num_routers", type=int, nargs="+", default=[8, 32])
+    parser.add_argument(
+        "--nodes_per_router", type=int, nargs="+", default=[1, 8]
+    )
+    parser.add_argument(
+        "--sparsity",
+        type=float,
+        nargs="+",
+        default=[0.15],
+        help="only used by the random topology",
+    )
+    parser.add_argument("--ecmp", action="store_true")
+    parser.add_argument("--aggregate_routes", action="store_true")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="../output/bench_setup.tsv")
+    parser.add_argument(
+        "--baseline",
+        default=None,
+        help="earlier output to compare the time of each stage against",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=1.5,
+        help="slowdown over --baseline reported as a regression",
+    )
+    return parser.parse_args()
+
+
+class Intf(object):
+    """The parts of a Mininet interface that ClickSwitch uses."""
+
+    def __init__(self, name, node, mac):
+        self.name = name
+        self.node = node
+        self.mac = mac
+        self.link = None
+
+    def IP(self):
+        # Like Mininet, only host interfaces have an address.
+        return getattr(self.node, "ip", None)
+
+    def MAC(self):
+        return self.mac
+
+    def __str__(self):
+        return self.name
+
+
+class Link(object):
+    """A link between two stand-in nodes, numbering interfaces from eth0 the
+    way Mininet.addLink does.
+    """
+
+    def __init__(self, node1, node2, macs):
+        self.intf1 = node1.add_intf(self, next(macs))
+        self.intf2 = node2.add_intf(self, next(macs))
+
+
+class Node(object):
+    # Mininet numbers host ports from 0 and switch ports from 1.
+    port_base = 0
+
+    def add_intf(self, link, mac):
+        port = self.port_base + len(self.intfs)
+        intf = Intf("{}-eth{}".format(self.name, port), self, mac)
+        intf.link = link
+        self.intfs[port] = intf
+        return intf
+
+
+class Host(Node):
+    def __init__(self, name, ip):
+        self.name = name
+        self.ip = ip
+        self.intfs = {}
+
+    def IP(self):
+        return self.ip
+
+
+class Switch(Node, click.ClickUserSwitch):
+    """A ClickUserSwitch without Mininet's shell: only the configuration
+    methods can be used.
+    """
+
+    port_base = 1
+
+    def __init__(self, name, **options):
+        self.name = name
+        self.intfs = {}
+        click.ClickConfig.__init__(self, name, **options)
+        self.log_file = "/dev/null"
+        self.batch = True
+        self.rt_layout = None
+        self._control = None
+
+    def IP(self):
+        return None
+
+
+def mac_addresses():
+    for i in itertools.count(1):
+        yield "02:00:{:02x}:{:02x}:{:02x}:{:02x}".format(
+            (i >> 24) & 255, (i >> 16) & 255, (i >> 8) & 255, i & 255
+        )
+
+
+def create_topology(args, seed):
+    return topology.create_spec(
+        args.topology,
+        args.num_routers,
+        args.nodes_per_router,
+        args.sparsity,
+        seed,
+    )
+
+
+def build(args, spec):
+    """Add switches, hosts and links as start.initialize_topology does.
+    Returns the switches and the hosts attached to each.
+    """
+    params = collections.OrderedDict(
+        [("ecmp", args.ecmp), ("aggregate_routes", args.aggregate_routes)]
+    )
+    macs = mac_addresses()
+    switches = []
+    attached_hosts = []
+    num_hosts = 0
+    for j in range(spec["num_switches"]):
+        has_hosts = spec["hosts"][j] > 0
+        opts = dict(params)
+        if args.aggregate_routes and has_hosts:
+            net_num, prefix_len = start.router_subnet(j)
+            opts["subnet"] = "{}/{}".format(start.ipStr(net_num), prefix_len)
+        switches.append(Switch("s" + str(j), **opts))
+        attached_hosts.append([])
+        if has_hosts:
+            for i in range(spec["hosts"][j]):
+                num_hosts += 1
+                if args.aggregate_routes:
+                    ip = start.ipStr(net_num + i + 1)
+                else:
+                    ip = start.ipStr(0x0A000000 + num_hosts)
+                host = Host("h" + str(num_hosts - 1), ip)
+                attached_hosts[-1].append(host)
+                Link(host, switches[-1], macs)
+    for i, j in spec["edges"].tolist():
+        Link(switches[i], switches[j], macs)
+    return switches, attached_hosts
+
+
+def max_rss():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class StageTimer(object):
+    """Times stages or, with `trace`, measures the memory each one allocates
+    with tracemalloc. Without tracemalloc (Python 2) every pass measures both,
+    memory as the growth of the process's peak RSS, which costs nothing but
+    only shows stages that set a new peak.
+    """
+
+    def __init__(self, trace=False):
+        self.trace = trace and tracemalloc is not None
+        self.seconds = collections.OrderedDict()
+        self.peak = collections.OrderedDict()
+        if self.trace:
+            tracemalloc.start()
+
+    def stop(self):
+        if self.trace:
+            tracemalloc.stop()
+
+    def run(self, stage, f, *args):
+        if self.trace:
+            tracemalloc.clear_traces()
+            before = tracemalloc.get_traced_memory()[0]
+        elif tracemalloc is None:
+            before = max_rss()
+        t = time.time()
+        result = f(*args)
+        seconds = time.time() - t
+        if self.trace:
+            self.peak[stage] = tracemalloc.get_traced_memory()[1] - before
+        else:
+            self.seconds[stage] = seconds
+            if tracemalloc is None:
+                self.peak[stage] = max_rss() - before
+        return result
+
+
+def run_once(args, seed, trace=False):
+    """Build the network from `seed` stage by stage; returns the StageTimer,
+    the number of switches and the total size of their configs.
+    """
+    timer = StageTimer(trace)
+    try:
+        spec = timer.run("topology", create_topology, args, seed)
+        switches, attached_hosts = timer.run("build", build, args, spec)
+        timer.run("neighbors", lambda: [s.init_neighbors() for s in switches])
+        timer.run(
+            "routes",
+            lambda: routing.install_routes(
+                switches,
+                attached_hosts,
+                routing.adjacency_from_edges(
+                    spec["num_switches"], spec["edges"]
+                ),
+                args.ecmp,
+            ),
+        )
+        configs = timer.run(
+            "config", lambda: [s.make_config() for s in switches]
+        )
+        # What ClickSwitch.batchStartup sends to its rendering processes.
+        snapshots = timer.run(
+            "snapshot",
+            lambda: [click.ConfigSnapshot(s).make_config() for s in switches],
+        )
+        assert snapshots == configs
+    finally:
+        timer.stop()
+    return timer, len(switches), sum(len(c) for c in configs)
+
+
+def benchmark(args):
+    """Run every combination of the swept parameters; returns a row per
+    stage of each run.
+    """
+    rows = []
+    sparsities = args.sparsity if args.topology == "random" else [None]
+    for num_routers, nodes_per_router, sparsity in itertools.product(
+        args.num_routers, args.nodes_per_router, sparsities
+    ):
+        run_args = start.dotdict(vars(args))
+        run_args.update(
+            num_routers=num_routers,
+            nodes_per_router=nodes_per_router,
+            sparsity=sparsity,
+        )
+        for i in range(args.repeat):
+            seed = np.random.randint(2**31 - 1)
+            timer, switches, config_bytes = run_once(run_args, seed)
+            peaks = timer.peak
+            if tracemalloc:
+                peaks = run_once(run_args, seed, trace=True)[0].peak
+            for stage, seconds in timer.seconds.items():
+                row = collections.OrderedDict()
+                row["topology"] = args.topology
+                row["num_routers"] = num_routers
+                row["nodes_per_router"] = nodes_per_router
+                row["sparsity"] = sparsity
+                row["ecmp"] = bool(args.ecmp)
+                row["aggregate_routes"] = bool(args.aggregate_routes)
+                row["repeat"] = i
+                row["switches"] = switches
+                row["config_bytes"] = config_bytes
+                row["stage"] = stage
+                row["seconds"] = seconds
+                row["peak_bytes"] = peaks[stage]
+                rows.append(row)
+            print(
+                "{} routers x {} hosts, sparsity {}: {:.3f}s".format(
+                    num_routers,
+                    nodes_per_router,
+                    sparsity,
+                    sum(timer.seconds.values()),
+                )
+            )
+    return rows
+
+
+def run_key(row):
+    return tuple(
+        str(row[k])
+        for k in (
+            "topology",
+            "num_routers",
+            "nodes_per_router",
+            "sparsity",
+            "ecmp",
+            "aggregate_routes",
+            "stage",
+        )
+    )
+
+
+def best_times(rows):
+    """The fastest repeat of each stage of each run."""
+    best = {}
+    for row in rows:
+        k = run_key(row)
+        best[k] = min(best.get(k, float("inf")), float(row["seconds"]))
+    return best
+
+
+def regressions(rows, baseline_rows, tolerance):
+    """The stages at least `tolerance` times slower than in the baseline,
+    as (key, baseline seconds, seconds).
+    """
+    baseline = best_times(baseline_rows)
+    slower = []
+    for k, seconds in sorted(best_times(rows).items()):
+        if k in baseline and seconds > tolerance * baseline[k]:
+            slower.append((k, baseline[k], seconds))
+    return slower
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    np.random.seed(args.seed)
+    rows = benchmark(args)
+    out_dir = os.path.dirname(args.output)
+    if out_dir and not os.path.exists(out_dir):
+        os.makedirs(out_dir)
+    start.append_rows(args.output, rows)
+    print("wrote {} rows to {}".format(len(rows), args.output))
+    if args.baseline:
+        slower = regressions(
+            rows, runner.read_rows(args.baseline), args.tolerance
+        )
+        for k, before, after in slower:
+            print(
+                "regression: {} {:.4f}s -> {:.4f}s".format(
+                    " ".join(k), before, after
+                )
+            )
+        if slower:
+            sys.exit(1)
@@ -4,77 +4,249 @@ Forked from https://github.com/frawi/click-mininet
 """
 import collections
 import itertools
+import multiprocessing
+import os
+import time
 from string import Template
 
 from mininet.node import Switch
 from mininet.util import ipParse, ipStr
 
+import control
+import routing
+
 Entry = collections.namedtuple("Entry", ["node", "intf_to_node"])
 
-debug = False
+# Click elements that can serve as the routing table (`rt`).
+LOOKUP_ELEMENTS = (
+    "StaticIPLookup",
+    "LinearIPLookup",
+    "RadixIPLookup",
+    "DirectIPLookup",
+)
 
+# Lookup elements with add/set/remove handlers, whose routes can be changed
+# while the router runs (see ClickSwitch.update_routes).
+DYNAMIC_LOOKUP_ELEMENTS = ("LinearIPLookup", "RadixIPLookup", "DirectIPLookup")
 
-class ClickSwitch(Switch):
-    """Use ClickUserSwitch or ClickKernelSwitch"""
+# How ARP requests reach the per-interface proxy ARP responders: "tee" copies
+# each request to every interface's full table and drops all but one copy with
+# `CheckPaint`; "paint_switch" demuxes by input interface to a prefix table.
+ARP_MODES = ("tee", "paint_switch")
 
-    @property
-    def install_cmd(self):
-        raise NotImplementedError
+# Output queue disciplines. "RED" drops early with RED in front of a queue;
+# "Prio" adds a second queue for ARP replies that PrioSched always serves
+# before data packets.
+QUEUE_KINDS = ("Queue", "ThreadSafeQueue", "FrontDropQueue", "RED", "Prio")
 
-    @property
-    def uninstall_cmd(self):
-        raise NotImplementedError
+# How a switch reads packets from its interfaces. "default" is a plain
+# FromDevice, which picks its own method; "pcap", "linux" (a packet socket,
+# without libpcap's copy) and "netmap" set the user-level FromDevice METHOD;
+# "poll" uses the kernel module's PollDevice, which needs a driver that
+# supports polling. ClickSwitch.capture_methods lists the ones each kind of
+# switch accepts.
+CAPTURE_METHODS = ("default", "pcap", "linux", "netmap", "poll")
 
-    def __init__(self, name, switch_type="router", log_file=None, **params):
-        Switch.__init__(self, name, **params)
-        self.log_file = log_file if log_file else "log/{}.log".format(self.name)
-        if switch_type == "simple_switch":
-            self.make_config = self.simple_switch
-        elif switch_type == "router":
-            self.make_config = self.router
-        else:
-            raise NotImplementedError(switch_type)
+QueueSpec = collections.namedtuple("QueueSpec", ["kind", "depth"])
 
-    def links(self):
-        return [intf.link for intf in self.intfs.values() if intf.name != "lo"]
+# Read handlers reported by ClickSwitch.read_counters, by element class.
+_QUEUE_HANDLERS = ("length", "highwater_length", "drops", "capacity")
+COUNTER_HANDLERS = {
+    "Counter": ("count", "rate"),
+    "Queue": _QUEUE_HANDLERS,
+    "ThreadSafeQueue": _QUEUE_HANDLERS,
+    "FrontDropQueue": _QUEUE_HANDLERS,
+    "RED": ("drops",),
+}
 
-    def intf_from_name(self, name):
-        return [intf for intf in self.intfs.values() if intf.name == name][0]
 
-    def init_neighbors(self):
-        self.node_table = {}
-        self.intf_to_neighbor = {}
-        for l in self.links():
-            neighbor_intf = l.intf1 if l.intf1.node != self else l.intf2
-            self_intf = l.intf1 if l.intf1.node == self else l.intf2
-            self.intf_to_neighbor[self_intf.name] = neighbor_intf.node
-            self.node_table[neighbor_intf.node.name] = Entry(
-                node=neighbor_intf.node,
-                intf_to_node=self_intf,
-            )
+def parse_queue_spec(spec):
+    """Parse a comma-separated list of per-port queues, each KIND[:DEPTH]
+    (e.g. "Queue:64,RED:1024"). Port i gets the i-th entry and the last
+    entry applies to the remaining ports. A missing depth is None, i.e. the
+    switch type's default.
+    """
+    queues = []
+    for entry in spec.split(","):
+        kind, _, depth = entry.strip().partition(":")
+        if kind not in QUEUE_KINDS:
+            raise NotImplementedError(kind)
+        queues.append(QueueSpec(kind=kind, depth=int(depth) if depth else None))
+    return queues
 
-    def update(self):
-        neighbors = list(self.intf_to_neighbor.items())
-        updated = False
-        for intf, n in neighbors:
-            if not hasattr(n, "node_table"):
-                continue
-            for name, entry in n.node_table.items():
-                if name not in self.node_table and name != self.name:
-                    updated = True
-                    self.node_table[name] = Entry(
-                        node=entry.node,
-                        intf_to_node=self.intf_from_name(intf),
-                    )
-        return updated
 
-    def router(self):
+debug = False
+
+
+# Options of ClickConfig, i.e. everything but the routes that a switch's
+# configuration depends on.
+CONFIG_OPTIONS = (
+    "switch_type",
+    "ecmp",
+    "lookup",
+    "aggregate_routes",
+    "subnet",
+    "arp",
+    "threads",
+    "queue",
+    "counters",
+    "trace_sample",
+    "trace_filter",
+    "capture",
+    "fast_path",
+    "verify_checksum",
+    "batch_size",
+)
+
+# Worker processes used by ClickSwitch.batchStartup to render configs (None
+# for one per CPU), and how long (s) it waits for every switch to come up.
+config_workers = None
+ready_timeout = 30.0
+
+
+class ClickConfig(object):
+    """Renders a switch's Click configuration from its options and its
+    node_table and multipath routes. ClickSwitch fills those in from the
+    Mininet network; ConfigSnapshot copies them into plain objects that can
+    be sent to another process.
+    """
+
+    def __init__(
+        self,
+        name,
+        switch_type="router",
+        ecmp=False,
+        lookup="StaticIPLookup",
+        aggregate_routes=False,
+        subnet=None,
+        arp="tee",
+        threads=1,
+        queue=None,
+        counters=False,
+        trace_sample=0,
+        trace_filter=None,
+        capture="default",
+        fast_path=False,
+        verify_checksum=True,
+        batch_size=None,
+    ):
+        self.name = name
+        self.options = dict(
+            switch_type=switch_type,
+            ecmp=ecmp,
+            lookup=lookup,
+            aggregate_routes=aggregate_routes,
+            subnet=subnet,
+            arp=arp,
+            threads=threads,
+            queue=queue,
+            counters=counters,
+            trace_sample=trace_sample,
+            trace_filter=trace_filter,
+            capture=capture,
+            fast_path=fast_path,
+            verify_checksum=verify_checksum,
+            batch_size=batch_size,
+        )
+        if switch_type not in ("simple_switch", "router"):
+            raise NotImplementedError(switch_type)
+        self.switch_type = switch_type
+        # Hash flows across every equal-cost next hop instead of using one.
+        self.ecmp = ecmp
+        if lookup not in LOOKUP_ELEMENTS:
+            raise NotImplementedError(lookup)
+        self.lookup = lookup
+        # `subnet` covers the hosts attached to this switch (e.g.
+        # "10.0.1.0/24"). With `aggregate_routes`, other switches route to the
+        # subnet instead of to each host and merge prefixes sharing an output.
+        self.aggregate_routes = aggregate_routes
+        self.subnet = subnet
+        if arp not in ARP_MODES:
+            raise NotImplementedError(arp)
+        self.arp = arp
+        # Run Click with this many threads, one interface's path per thread.
+        self.threads = threads
+        # Output queue for each port (see parse_queue_spec); the default is a
+        # Queue of the switch type's default depth.
+        self.queues = parse_queue_spec(queue) if queue else []
+        if threads > 1 and any(q.kind == "FrontDropQueue" for q in self.queues):
+            # Several threads push to each queue (see output_queue) and
+            # Click has no thread-safe FrontDropQueue.
+            raise NotImplementedError("FrontDropQueue with threads > 1")
+        # Count packets with `Counter` elements at each stage of the router
+        # (see read_counters).
+        self.counters = counters
+        # Log a timestamp for sampled IP packets as they enter and leave the
+        # switch (see trace_taps and tracing.py). Packets are sampled by
+        # their IP ID, 1 in `trace_sample` (a power of 2), so every switch
+        # picks the same ones; `trace_filter` is an extra Classifier pattern
+        # over the Ethernet frame (e.g. "36/138d" for UDP port 5005).
+        assert trace_sample & (trace_sample - 1) == 0, trace_sample
+        self.trace_sample = trace_sample
+        self.trace_filter = trace_filter
+        # Read packets with the `capture` method (see CAPTURE_METHODS).
+        if capture not in CAPTURE_METHODS:
+            raise NotImplementedError(capture)
+        self.capture = capture
+        # Forward IP packets with their Ethernet header in place, rewriting
+        # its addresses, instead of stripping and re-encapsulating them (see
+        # ip_input and encap). `verify_checksum` can turn off CheckIPHeader's
+        # checksum check on either path.
+        self.fast_path = fast_path
+        self.verify_checksum = verify_checksum
+        # Move up to `batch_size` packets each time a FromDevice, PollDevice
+        # or ToDevice runs (see from_device and to_device) rather than the
+        # element's default, so the per-run cost is spread over more packets.
+        self.batch_size = batch_size
+
+    def make_config(self):
+        if self.switch_type == "simple_switch":
+            return self.simple_switch()
+        return self.router()
+
+    def route_ports(self):
+        """The nodes in the routing table, the interfaces in port order, the
+        `rt` output for each node and the interfaces of each ECMP group.
+        Nodes with several equal-cost next hops go to an extra output per
+        distinct set of interfaces, after the per-interface outputs.
+        """
         # Sort by the name of the host (e.g. h0).
         nodes = sorted(self.node_table.values(), key=lambda n: n.node.name)
         intfs = sorted(
             list(set([n.intf_to_node for n in nodes])), key=lambda i: i.name
         )
         intf_to_idx = {intf.name: idx for idx, intf in enumerate(intfs)}
+        node_port = {}
+        groups = []
+        group_to_port = {}
+        for n in nodes:
+            if n.node.name not in self.multipath:
+                node_port[n.node.name] = intf_to_idx[n.intf_to_node.name]
+                continue
+            group = tuple(
+                sorted(intf_to_idx[i.name] for i in self.multipath[n.node.name])
+            )
+            if group not in group_to_port:
+                group_to_port[group] = len(intfs) + len(groups)
+                groups.append(group)
+            node_port[n.node.name] = group_to_port[group]
+        return nodes, intfs, node_port, groups
+
+    def route_entries(self, nodes, node_port):
+        """Routes of the `rt` table as (network, prefix length, port)."""
+        # Static routing table maps IP address to the index of the interface.
+        routes = [
+            (ipParse(n.node.IP()), 32, node_port[n.node.name])
+            for n in nodes
+            if n.node.IP()
+        ]
+        if self.aggregate_routes:
+            routes = self.aggregate(nodes, node_port, routes)
+        return routes
+
+    def router(self):
+        nodes, intfs, node_port, groups = self.route_ports()
+        intf_to_idx = {intf.name: idx for idx, intf in enumerate(intfs)}
 
         out = []
 
@@ -91,6 +263,8 @@ class ClickSwitch(Switch):
             )
         out[-1] += "\n"
 
+        out += self.trace_taps()
+
         # Three buckets: ARP request, ARP response, IP packets, anything else.
         out.append(
             "c0 :: Classifier(12/0806 20/0001, 12/0806 20/0002, "
@@ -103,11 +277,12 @@ class ClickSwitch(Switch):
             out.append(
                 "\n".join(
                     [
-                        "FromDevice('{}')".format(intf.name),
+                        self.from_device(idx, intf.name),
                         "-> Print(got{})".format(idx),
-                        "-> Paint({})".format(idx),
-                        "-> [0]c0;\n",
                     ]
+                    + self.counter("cin{}".format(idx))
+                    + self.trace_tap("in{}".format(idx))
+                    + ["-> Paint({})".format(idx), "-> [0]c0;\n"]
                 )
             )
 
@@ -115,61 +290,86 @@ class ClickSwitch(Switch):
         for idx, intf in enumerate(intfs):
             out.append(
                 "\n".join(
-                    [
-                        "out{} :: Queue(1024)".format(idx),
-                        "-> Print(out{})".format(idx),
-                        "-> ToDevice('{}');\n".format(intf),
-                    ]
+                    self.output_queue(idx, 1024)
+                    + ["-> Print(out{})".format(idx)]
+                    + self.counter("cout{}".format(idx))
+                    + ["-> {};\n".format(self.to_device(idx, intf.name))]
                 )
             )
 
         # Proxy ARP for every request. I.e. if the topography is:
         #   h1 -- s0-eth1 : s0 : s0-eth2 -- h2
         # and h1 sends an ARP request for h2, respond with "s0-eth1".
+        host_ips = [
+            n.node.IP()
+            for n in nodes
+            if n.node.IP()  # switches don't have IP addresses
+        ]
+        if self.arp == "paint_switch" and host_ips:
+            # One entry for the network covering every host, however many
+            # there are. Answering for an unused address is harmless: `rt`
+            # has no route for it and drops the packet.
+            net, prefix_len = routing.covering_prefix(
+                [ipParse(ip) for ip in host_ips]
+            )
+            host_ips = ["{}/{}".format(ipStr(net), prefix_len)]
         arp_responder_s = "ARPResponder(\n  "
         arp_responder_s += ",\n  ".join(
-            [
-                "{} $mac".format(n.node.IP())
-                for n in nodes
-                if n.node.IP()  # switches don't have IP addresses
-            ]
+            ["{} $mac".format(ip) for ip in host_ips]
         )
         arp_responder_s += ")"
         arp_responder_t = Template(arp_responder_s)
 
-        # `Tee` splits the request to n channels (one per interface). For each
-        # interface, respond with the proxy ARP table.
-        out.append("c0[0] -> arpt :: Tee({});\n".format(len(intfs)))
-        for idx, intf in enumerate(intfs):
+        if self.arp == "paint_switch":
+            # `PaintSwitch` sends each request only to the branch for the
+            # interface it arrived on (see `Paint` above).
             out.append(
-                "\n".join(
-                    [
-                        "arpt[{}]".format(idx),
-                        "-> CheckPaint({})".format(idx),
-                        "-> Print(arp_req_from{})".format(idx),
-                        "-> {}".format(
-                            arp_responder_t.substitute(mac=intf.MAC())
-                        ),
-                        "-> Print(arp_response)",
-                        "-> out{};\n".format(idx),
-                    ]
+                " ".join(
+                    ["c0[0]"]
+                    + self.counter("cc0")
+                    + ["-> arpt :: PaintSwitch;\n"]
                 )
             )
+        else:
+            # `Tee` splits the request to n channels (one per interface). For
+            # each interface, respond with the proxy ARP table.
+            out.append(
+                " ".join(
+                    ["c0[0]"]
+                    + self.counter("cc0")
+                    + ["-> arpt :: Tee({});\n".format(len(intfs))]
+                )
+            )
+        for idx, intf in enumerate(intfs):
+            branch = ["arpt[{}]".format(idx)]
+            if self.arp == "tee":
+                branch.append("-> CheckPaint({})".format(idx))
+            branch += [
+                "-> Print(arp_req_from{})".format(idx),
+                "-> {}".format(arp_responder_t.substitute(mac=intf.MAC())),
+                "-> Print(arp_response)",
+                "-> {};\n".format(self.control_queue(idx)),
+            ]
+            out.append("\n".join(branch))
 
         # ARP responses--just toss because we know where everything is.
-        out.append("c0[1] -> Discard;\n")
+        out.append(
+            " ".join(["c0[1]"] + self.counter("cc1") + ["-> Discard;\n"])
+        )
 
         # non-IP packets are dropped.
-        out.append("c0[3] -> Discard;\n")
+        out.append(
+            " ".join(["c0[3]"] + self.counter("cc3") + ["-> Discard;\n"])
+        )
 
-        # IP request. Static routing table maps IP address to the index of the
-        # interface.
-        rt = "rt :: StaticIPLookup(\n  "
+        # IP request. The routing table maps IP addresses to the index of the
+        # interface (see route_ports).
+        routes = self.route_entries(nodes, node_port)
+        rt = "rt :: {}(\n  ".format(self.lookup)
         rt += ",\n  ".join(
             [
-                "{}/32 {}".format(n.node.IP(), intf_to_idx[n.intf_to_node.name])
-                for n in nodes
-                if n.node.IP()
+                "{}/{} {}".format(ipStr(net), prefix_len, port)
+                for net, prefix_len, port in routes
             ]
         )
         rt += ");\n"
@@ -177,46 +377,132 @@ class ClickSwitch(Switch):
 
         out.append(
             "\n".join(
-                [
-                    "c0[2]",
+                ["c0[2]"]
+                + self.counter("cc2")
+                + [
                     "-> Print(ip_req)",
-                    "-> Strip(14)",  # Strip ethernet header
-                    "-> Print(stripped)",
-                    "-> CheckIPHeader",
-                    "-> GetIPAddress(16)",
+                ]
+                + self.ip_input()
+                + [
                     "-> Print(ip)",
                     "-> [0]rt;\n",
                 ]
             )
         )
 
-        # Route requests to the correct interface.
-        for idx, intf in enumerate(intfs):
+        def encap(idx):
+            intf = intfs[idx]
             src_mac = intf.MAC()
             dst_mac = (
                 intf.link.intf1 if intf.link.intf1 != intf else intf.link.intf2
             ).MAC()
+            if self.fast_path:
+                return "-> EtherRewrite({}, {})".format(src_mac, dst_mac)
+            return "-> EtherEncap(0x0800, {}, {})".format(src_mac, dst_mac)
+
+        # Route requests to the correct interface.
+        for idx, intf in enumerate(intfs):
             out.append(
                 "\n".join(
-                    [
-                        "rt[{}]".format(idx),
+                    ["rt[{}]".format(idx)]
+                    + self.counter("crt{}".format(idx))
+                    + [
                         "-> Print(out{})".format(idx),
-                        "-> EtherEncap(0x0800, {}, {})".format(
-                            src_mac, dst_mac
-                        ),
+                        encap(idx),
                         "-> Print(ether)",
+                    ]
+                    + self.trace_tap("out{}".format(idx))
+                    + [
                         "-> out{};\n".format(idx),
                     ]
                 )
             )
 
+        # Hash flows (by source and destination address) across the
+        # interfaces of each ECMP group.
+        for g, group in enumerate(groups):
+            port = len(intfs) + g
+            out.append(
+                " ".join(
+                    ["rt[{}]".format(port)]
+                    + self.counter("crt{}".format(port))
+                    + [
+                        "-> ecmp{} :: HashSwitch({}, 8);\n".format(
+                            g, 26 if self.fast_path else 12
+                        )
+                    ]
+                )
+            )
+            for i, idx in enumerate(group):
+                out.append(
+                    "\n".join(
+                        [
+                            "ecmp{}[{}]".format(g, i),
+                            "-> Print(ecmp{}_out{})".format(g, idx),
+                            encap(idx),
+                        ]
+                        + self.trace_tap("out{}".format(idx))
+                        + ["-> out{};\n".format(idx)]
+                    )
+                )
+
+        out += self.thread_sched(len(intfs))
+
         config = "\n".join(out)
         if not debug:
             config = "\n".join(
-                [l for l in config.split("\n") if "Print" not in l]
+                [l for l in config.split("\n") if not l.startswith("-> Print(")]
             )
         return config + "\n"
 
+    def ip_input(self):
+        """Config lines taking an IP packet in an Ethernet frame to the
+        routing table: checked, with its destination address annotation
+        set. The fast path leaves the Ethernet header on and reads the IP
+        header at offset 14.
+        """
+        check = []
+        if self.fast_path:
+            check.append("OFFSET 14")
+        if not self.verify_checksum:
+            check.append("VERIFY_CHECKSUM false")
+        check_ip = "-> CheckIPHeader" + (
+            "({})".format(", ".join(check)) if check else ""
+        )
+        if self.fast_path:
+            return [check_ip, "-> GetIPAddress(30)"]
+        return [
+            "-> Strip(14)",  # Strip ethernet header
+            "-> Print(stripped)",
+            check_ip,
+            "-> GetIPAddress(16)",
+        ]
+
+    def aggregate(self, nodes, node_port, routes):
+        """Replace host routes covered by another router's subnet with a route
+        to that subnet, then collapse prefixes that share an output. Every
+        host in a router's subnet is reached through that router, so this
+        doesn't change where any packet goes.
+        """
+        subnets = []
+        for n in nodes:
+            subnet = getattr(n.node, "subnet", None)
+            if subnet:
+                net, prefix_len = subnet.split("/")
+                subnets.append(
+                    (ipParse(net), int(prefix_len), node_port[n.node.name])
+                )
+        covered = set((net, prefix_len) for net, prefix_len, _ in subnets)
+        prefix_lens = set(prefix_len for _, prefix_len, _ in subnets)
+        hosts = [
+            (ip, prefix_len, port)
+            for ip, prefix_len, port in routes
+            if not any(
+                (ip & routing.prefix_mask(p), p) in covered for p in prefix_lens
+            )
+        ]
+        return routing.collapse_prefixes(subnets + hosts)
+
     def simple_switch(self):
         links = self.links()
         ip_to_intf = [(l.intf1.IP(), l.intf1.name) for l in links]
@@ -225,51 +511,537 @@ class ClickSwitch(Switch):
         from_device = Template(
             "\n".join(
                 [
-                    "FromDevice('$src') ",
-                    "-> Queue(8) ",
-                    "-> ToDevice('$dst');",
+                    # Declare the queue (out$i) before connecting to it.
+                    "$queue ",
+                    "-> $to_device;",
+                    "$from_device ",
+                    "-> out$i;",
                 ]
             )
         )
         return "\n".join(
             [
                 from_device.substitute(
-                    src=intfs[i], dst=intfs[(i + 1) % len(intfs)]
+                    i=i,
+                    from_device=self.from_device(i, intfs[i]),
+                    to_device=self.to_device(i, intfs[(i + 1) % len(intfs)]),
+                    queue="\n".join(self.output_queue(i, 8, control=False)),
                 )
                 for i in xrange(len(intfs))
             ]
+            + self.thread_sched(len(intfs))
         )
 
+    def from_device(self, idx, intf_name):
+        """The element reading packets from interface `idx`."""
+        args = ["'{}'".format(intf_name)]
+        if self.capture in ("pcap", "linux", "netmap"):
+            args.append("METHOD {}".format(self.capture.upper()))
+        if self.batch_size:
+            args.append("BURST {}".format(self.batch_size))
+        element = "PollDevice" if self.capture == "poll" else "FromDevice"
+        return "fd{} :: {}({})".format(idx, element, ", ".join(args))
+
+    def to_device(self, idx, intf_name):
+        """The element sending packets out of interface `idx`."""
+        args = ["'{}'".format(intf_name)]
+        if self.batch_size:
+            args.append("BURST {}".format(self.batch_size))
+        return "td{} :: ToDevice({})".format(idx, ", ".join(args))
+
+    def queue_spec(self, idx, default_depth):
+        if not self.queues:
+            return QueueSpec(kind="Queue", depth=default_depth)
+        spec = self.queues[min(idx, len(self.queues) - 1)]
+        return QueueSpec(kind=spec.kind, depth=spec.depth or default_depth)
+
+    def output_queue(self, idx, default_depth, control=True):
+        """Config lines for the queue in front of port idx's ToDevice: `out<i>`
+        takes pushed packets and the last line pulls from the queue. With
+        `control` and a "Prio" queue, `ctl<i>` (see control_queue) is a second
+        queue served first.
+        """
+        spec = self.queue_spec(idx, default_depth)
+        # With several threads, any input's thread may push to any queue.
+        queue_class = "ThreadSafeQueue" if self.threads > 1 else "Queue"
+        if spec.kind == "RED":
+            return [
+                "out{} :: RED({}, {}, 0.02)".format(
+                    idx, spec.depth // 4, 3 * spec.depth // 4
+                ),
+                "-> outq{} :: {}({})".format(idx, queue_class, spec.depth),
+            ]
+        if spec.kind == "Prio":
+            if not control:
+                return ["out{} :: {}({})".format(idx, queue_class, spec.depth)]
+            return [
+                "ctl{} :: {}({}) -> [0]ps{};".format(
+                    idx, queue_class, spec.depth, idx
+                ),
+                "out{} :: {}({}) -> [1]ps{};".format(
+                    idx, queue_class, spec.depth, idx
+                ),
+                "ps{} :: PrioSched".format(idx),
+            ]
+        kind = queue_class if spec.kind == "Queue" else spec.kind
+        return ["out{} :: {}({})".format(idx, kind, spec.depth)]
+
+    def control_queue(self, idx):
+        """Element that ARP replies for port idx are pushed to."""
+        if self.queue_spec(idx, None).kind == "Prio":
+            return "ctl{}".format(idx)
+        return "out{}".format(idx)
+
+    def counter(self, name):
+        """Config line inserting a Counter called `name`, if counting."""
+        return ["-> {} :: Counter".format(name)] if self.counters else []
+
+    def trace_taps(self):
+        """Config lines defining the TraceTap element used by trace_tap: it
+        prints the time, the Ethernet header and the IP and UDP headers of
+        sampled packets, tagged with `label`.
+        """
+        if not self.trace_sample and not self.trace_filter:
+            return []
+        pattern = ["12/0800"]
+        if self.trace_filter:
+            pattern.append(self.trace_filter)
+        if self.trace_sample > 1:
+            # The IP ID is at offset 18 of the frame.
+            pattern.append("18/0000%{:04x}".format(self.trace_sample - 1))
+        return [
+            "\n".join(
+                [
+                    "elementclass TraceTap { $label |",
+                    "  input -> sample :: Classifier({}, -);".format(
+                        " ".join(pattern)
+                    ),
+                    "  sample[0] -> SetTimestamp",
+                    "    -> Print($label, MAXLENGTH 42, TIMESTAMP true)",
+                    "    -> output;",
+                    "  sample[1] -> output;",
+                    "}\n",
+                ]
+            )
+        ]
+
+    def trace_tap(self, point):
+        """Config line inserting a TraceTap labelled <switch>.<point>."""
+        if not self.trace_sample and not self.trace_filter:
+            return []
+        return ["-> TraceTap({}.{})".format(self.name, point)]
+
+    def thread_sched(self, n):
+        """Pin the FromDevice (fd<i>) and ToDevice (td<i>) of the i-th of n
+        paths to the same thread, spreading the paths across the threads.
+        """
+        if self.threads <= 1:
+            return []
+        return [
+            "StaticThreadSched(\n  {});\n".format(
+                ",\n  ".join(
+                    "fd{0} {1}, td{0} {1}".format(i, i % self.threads)
+                    for i in xrange(n)
+                )
+            )
+        ]
+
+
+class NodeInfo(object):
+    """The parts of a Mininet node that ClickConfig uses."""
+
+    def __init__(self, node):
+        self.name = node.name
+        self.ip = node.IP()
+        self.subnet = getattr(node, "subnet", None)
+
+    def IP(self):
+        return self.ip
+
+
+class IntfInfo(object):
+    """The parts of a Mininet interface that ClickConfig uses."""
+
+    def __init__(self, intf):
+        self.name = intf.name
+        self.ip = intf.IP()
+        self.mac = intf.MAC()
+        self.link = None
+
+    def IP(self):
+        return self.ip
+
+    def MAC(self):
+        return self.mac
+
+    def __str__(self):
+        return self.name
+
+
+class LinkInfo(object):
+    intf1 = None
+    intf2 = None
+
+
+class ConfigSnapshot(ClickConfig):
+    """A picklable copy of a switch's options and routes: make_config()
+    gives the same configuration as the switch's.
+    """
+
+    def __init__(self, switch):
+        ClickConfig.__init__(self, switch.name, **switch.options)
+        # Copy each interface once, with its link, so that interfaces can
+        # still be told apart by identity.
+        copies = {}
+
+        def copy(intf):
+            if intf not in copies:
+                info = copies[intf] = IntfInfo(intf)
+                if intf.link:
+                    info.link = LinkInfo()
+                    info.link.intf1 = copy(intf.link.intf1)
+                    info.link.intf2 = copy(intf.link.intf2)
+            return copies[intf]
+
+        self._links = [copy(l.intf1).link for l in switch.links()]
+        self.node_table = {
+            name: Entry(
+                node=NodeInfo(n.node), intf_to_node=copy(n.intf_to_node)
+            )
+            for name, n in switch.node_table.items()
+        }
+        self.multipath = {
+            name: [copy(intf) for intf in intfs]
+            for name, intfs in switch.multipath.items()
+        }
+
+    def links(self):
+        return self._links
+
+
+def render_config(snapshot):
+    """Process pool worker for render_configs."""
+    return snapshot.make_config()
+
+
+def render_configs(switches):
+    """Render the switches' configs in config_workers processes."""
+    pool = multiprocessing.Pool(config_workers)
+    try:
+        return pool.map(render_config, [ConfigSnapshot(s) for s in switches])
+    finally:
+        pool.close()
+        pool.join()
+
+
+class ClickSwitch(Switch, ClickConfig):
+    """Use ClickUserSwitch or ClickKernelSwitch"""
+
+    # The CAPTURE_METHODS this kind of switch can run.
+    capture_methods = ("default",)
+
+    @property
+    def install_cmd(self):
+        raise NotImplementedError
+
+    @property
+    def uninstall_cmd(self):
+        raise NotImplementedError
+
+    def __init__(self, name, log_file=None, batch=False, **params):
+        """`params` are ClickConfig options (see CONFIG_OPTIONS) and Mininet
+        Switch parameters. With `batch`, start() does nothing and
+        batchStartup starts the switches together.
+        """
+        options = {k: params.pop(k) for k in CONFIG_OPTIONS if k in params}
+        Switch.__init__(self, name, **params)
+        ClickConfig.__init__(self, name, **options)
+        if self.capture not in self.capture_methods:
+            raise NotImplementedError(self.capture)
+        self.log_file = log_file if log_file else "log/{}.log".format(self.name)
+        self.batch = batch
+        self.rt_layout = None
+        # (config, rt layout) to start with instead of rendering the config,
+        # e.g. from configcache.
+        self.cached = None
+        self._control = None
+
+    def links(self):
+        return [intf.link for intf in self.intfs.values() if intf.name != "lo"]
+
+    def init_neighbors(self):
+        self.node_table = {}
+        self.multipath = {}
+        for l in self.links():
+            neighbor_intf = l.intf1 if l.intf1.node != self else l.intf2
+            self_intf = l.intf1 if l.intf1.node == self else l.intf2
+            self.node_table[neighbor_intf.node.name] = Entry(
+                node=neighbor_intf.node,
+                intf_to_node=self_intf,
+            )
+
+    def set_routes(self, routes):
+        """Route to each node in `routes` through the interfaces facing the
+        list of neighbors it maps to (see routing.install_routes). The first
+        neighbor is the primary next hop; with `ecmp`, the rest are kept in
+        self.multipath. Call after init_neighbors; directly connected nodes
+        keep their own interface.
+        """
+        for node, hops in routes.items():
+            if node.name in self.node_table or node.name == self.name:
+                continue
+            intfs = [self.node_table[hop.name].intf_to_node for hop in hops]
+            self.node_table[node.name] = Entry(
+                node=node,
+                intf_to_node=intfs[0],
+            )
+            if self.ecmp and len(intfs) > 1:
+                self.multipath[node.name] = intfs
+
+    def saved_routes(self):
+        """node_table and multipath by name, for restore_routes: each node's
+        name maps to the names of the interfaces towards it, the primary one
+        first.
+        """
+        return {
+            name: [
+                intf.name
+                for intf in self.multipath.get(name, [entry.intf_to_node])
+            ]
+            for name, entry in self.node_table.items()
+        }
+
+    def restore_routes(self, routes, nodes):
+        """Set node_table and multipath from saved_routes(), e.g. of a cached
+        config, instead of calling set_routes. `nodes` maps names to nodes.
+        """
+        intfs = {intf.name: intf for intf in self.intfs.values()}
+        self.node_table = {}
+        self.multipath = {}
+        for name, intf_names in routes.items():
+            self.node_table[name] = Entry(
+                node=nodes[name],
+                intf_to_node=intfs[intf_names[0]],
+            )
+            if len(intf_names) > 1:
+                self.multipath[name] = [intfs[i] for i in intf_names]
+
     def start(self, controllers):
+        if self.batch:
+            return
         if debug:
             print("click startup")
-        config = self.make_config()
+        if self.cached:
+            config_fn = self.write_config(*self.cached)
+        else:
+            config_fn = self.write_config(self.make_config())
+        self.cmd(self.launch_cmd(config_fn))
+
+    def write_config(self, config, rt_layout=None):
+        """Write `config` to config/<name>.click. `rt_layout` is the config's
+        port_layout(), if it wasn't rendered from the current routes.
+        """
+        if self.switch_type == "router":
+            # The `rt` outputs of the running config (see update_routes).
+            self.rt_layout = rt_layout or self.port_layout()
         config_fn = "config/{}.click".format(self.name)
         if debug:
             print("writing config to {}".format(config_fn))
         with open(config_fn, "w") as f:
             f.write(config)
+        return config_fn
+
+    def launch_cmd(self, config_fn):
         cmd = [self.install_cmd, config_fn]
+        if self.threads > 1:
+            cmd.insert(1, "--threads {}".format(self.threads))
         if self.log_file:
             cmd.append('> "%s" 2>&1' % self.log_file)
-        self.cmd(" ".join(cmd) + " &")
+        return " ".join(cmd) + " &"
+
+    @classmethod
+    def batchStartup(cls, switches, **_kwargs):
+        """Start the switches created with `batch` together: render the
+        configs that aren't cached in a process pool, launch every Click at
+        once and wait until all of them are running. Mininet.start() calls
+        this after start().
+        """
+        switches = [s for s in switches if s.batch]
+        if not switches:
+            return switches
+        if debug:
+            print("click batch startup")
+        rendered = [s for s in switches if not s.cached]
+        configs = {}
+        if rendered:
+            configs = dict(zip(rendered, render_configs(rendered)))
+        for s in switches:
+            if s.cached:
+                config_fn = s.write_config(*s.cached)
+            else:
+                config_fn = s.write_config(configs[s])
+            s.sendCmd(s.launch_cmd(config_fn))
+        for s in switches:
+            s.waitOutput()
+        deadline = time.time() + ready_timeout
+        waiting = switches
+        while True:
+            waiting = [s for s in waiting if not s.ready()]
+            if not waiting:
+                return switches
+            if time.time() > deadline:
+                raise RuntimeError(
+                    "Click not running on {} (see {})".format(
+                        ", ".join(s.name for s in waiting),
+                        ", ".join(s.log_file for s in waiting if s.log_file),
+                    )
+                )
+            time.sleep(0.1)
+
+    def port_layout(self):
+        nodes, intfs, node_port, groups = self.route_ports()
+        return [intf.name for intf in intfs], groups
+
+    def reconfigure(self):
+        """Hot-swap a freshly rendered config (e.g. with new routes or
+        queues) into the running Click, without restarting it. Elements of
+        the new router that have the same name and class as an old one take
+        over its state where the element supports it (e.g. queued packets).
+        """
+        self.hotswap(self.write_config(self.make_config()))
+
+    def hotswap(self, config_fn):
+        raise NotImplementedError
+
+    def update_routes(self):
+        """Bring the running router's routes in line with node_table and
+        multipath, e.g. after calling init_neighbors and set_routes for a
+        changed topology. If the `rt` outputs are unchanged and the lookup
+        element is dynamic, only the routes that differ are replaced, through
+        `rt`'s set and remove handlers. Otherwise the whole config is
+        hot-swapped. Returns the number of routes changed, or None if the
+        config was swapped.
+        """
+        assert self.switch_type == "router", self.switch_type
+        nodes, intfs, node_port, groups = self.route_ports()
+        if (
+            self.lookup not in DYNAMIC_LOOKUP_ELEMENTS
+            or self.port_layout() != self.rt_layout
+        ):
+            self.reconfigure()
+            return None
+        routes = {
+            (net, prefix_len): port
+            for net, prefix_len, port in self.route_entries(nodes, node_port)
+        }
+        old_routes = self.installed_routes()
+        changed = 0
+        for net, prefix_len in sorted(set(old_routes) - set(routes)):
+            self.write_handler(
+                "rt.remove", "{}/{}".format(ipStr(net), prefix_len)
+            )
+            changed += 1
+        for (net, prefix_len), port in sorted(routes.items()):
+            if old_routes.get((net, prefix_len)) != port:
+                self.write_handler(
+                    "rt.set", "{}/{} {}".format(ipStr(net), prefix_len, port)
+                )
+                changed += 1
+        return changed
+
+    def installed_routes(self):
+        """The running router's routes, {(network, prefix length): port}."""
+        routes = {}
+        # Each line of the table is "ADDR/LEN GATEWAY PORT", with "-" for no
+        # gateway.
+        for line in self.read_handler("rt.table").splitlines():
+            fields = line.split()
+            if fields:
+                net, _, prefix_len = fields[0].partition("/")
+                routes[(ipParse(net), int(prefix_len or 32))] = int(fields[-1])
+        return routes
+
+    def ready(self):
+        """Whether Click is running the router, i.e. it has opened every
+        device and answers handler reads.
+        """
+        try:
+            self.read_handler("list")
+        except (EnvironmentError, control.ControlSocketError):
+            return False
+        return True
 
     def stop(self):
         print("click shutdown")
+        if self._control:
+            self._control.close()
+            self._control = None
         self.cmd(self.uninstall_cmd)
 
+    def read_handler(self, handler):
+        """Value of a read handler, e.g. "out0.drops" or "list"."""
+        raise NotImplementedError
+
+    def write_handler(self, handler, value=""):
+        raise NotImplementedError
+
+    def read_counters(self):
+        """Snapshot of every Counter (count, rate) and queue (length,
+        highwater_length, drops, capacity) in the running router, keyed by
+        element name. Call repeatedly during a run to poll.
+        """
+        # The "list" handler is the element count followed by their names.
+        elements = self.read_handler("list").split()[1:]
+        snapshot = collections.OrderedDict()
+        for element in elements:
+            handlers = COUNTER_HANDLERS.get(
+                self.read_handler(element + ".class").strip()
+            )
+            if handlers:
+                snapshot[element] = collections.OrderedDict(
+                    (h, float(self.read_handler(element + "." + h)))
+                    for h in handlers
+                )
+        return snapshot
+
 
 class ClickUserSwitch(ClickSwitch):
+    capture_methods = ("default", "pcap", "linux", "netmap")
+
     @property
     def install_cmd(self):
-        return "click"
+        # --allow-reconfigure enables the hotconfig handler (see hotswap).
+        return "click --allow-reconfigure --unix-socket {}".format(
+            self.control_socket
+        )
 
     @property
     def uninstall_cmd(self):
-        return "kill %click"
+        return "kill %click; rm -f {}".format(self.control_socket)
+
+    @property
+    def control_socket(self):
+        return "/tmp/click-{}.sock".format(self.name)
+
+    def control(self):
+        if not self._control:
+            self._control = control.ControlSocket(self.control_socket)
+        return self._control
+
+    def read_handler(self, handler):
+        return self.control().read(handler)
+
+    def write_handler(self, handler, value=""):
+        return self.control().write(handler, value)
+
+    def hotswap(self, config_fn):
+        with open(config_fn) as f:
+            self.write_handler("hotconfig", f.read())
 
 
 class ClickKernelSwitch(ClickSwitch):
+    capture_methods = ("default", "poll")
+
     @property
     def install_cmd(self):
         return "click-install"
@@ -277,3 +1049,19 @@ class ClickKernelSwitch(ClickSwitch):
     @property
     def uninstall_cmd(self):
         return "click-uninstall"
+
+    def hotswap(self, config_fn):
+        self.cmd("click-install --hotswap {}".format(config_fn))
+
+    def handler_path(self, handler):
+        # Handlers are files under /click, e.g. /click/out0/drops.
+        element, _, name = handler.rpartition(".")
+        return os.path.join("/click", element.replace(".", "/"), name)
+
+    def read_handler(self, handler):
+        with open(self.handler_path(handler)) as f:
+            return f.read()
+
+    def write_handler(self, handler, value=""):
+        with open(self.handler_path(handler), "w") as f:
+            f.write(value)
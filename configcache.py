@@ -0,0 +1,114 @@
+"""
+On-disk cache of the Click configs of a network, so that a rerun of the same
+network (e.g. at another rate) skips computing routes and rendering configs.
+
+Entries are keyed by a hash of everything the configs depend on: the caller's
+description of the network and switch options, and the source of the modules
+that generate them. Each entry is a directory holding <switch>.click, the
+`rt` port layout of each switch (see ClickSwitch.update_routes) and its routes
+(see ClickSwitch.saved_routes), so that a cached network can still reroute and
+reconfigure. Entries not used recently are removed once there are more than
+`max_entries`.
+"""
+import hashlib
+import json
+import os
+import os.path
+import shutil
+import tempfile
+
+CACHE_DIR = "config/cache"
+
+# Modules whose code determines the configs: a change to any of them starts
+# a fresh set of keys.
+SOURCES = ("click.py", "routing.py", "start.py")
+
+LAYOUTS = "layouts.json"
+ROUTES = "routes.json"
+
+
+def source_digest():
+    h = hashlib.sha1()
+    here = os.path.dirname(os.path.abspath(__file__))
+    for fn in SOURCES:
+        with open(os.path.join(here, fn), "rb") as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+def cache_key(fields):
+    """Hash a JSON-serializable description of a network's configs."""
+    h = hashlib.sha1(source_digest().encode("ascii"))
+    h.update(json.dumps(fields, sort_keys=True).encode("utf-8"))
+    return h.hexdigest()
+
+
+class ConfigCache(object):
+    def __init__(self, directory=CACHE_DIR, max_entries=32):
+        self.directory = directory
+        self.max_entries = max_entries
+
+    def path(self, key):
+        return os.path.join(self.directory, key)
+
+    def load(self, key):
+        """Map each switch's name to its (config, rt layout, routes), or None
+        if the key isn't cached.
+        """
+        path = self.path(key)
+        try:
+            with open(os.path.join(path, LAYOUTS)) as f:
+                layouts = json.load(f)
+            with open(os.path.join(path, ROUTES)) as f:
+                routes = json.load(f)
+            entry = {}
+            for name, layout in layouts.items():
+                with open(os.path.join(path, name + ".click")) as f:
+                    config = f.read()
+                if layout is not None:
+                    # JSON has no tuples; port_layout() gives tuple groups.
+                    names, groups = layout
+                    layout = (names, [tuple(g) for g in groups])
+                entry[name] = (config, layout, routes[name])
+        except (EnvironmentError, KeyError):
+            return None
+        # Entries are evicted by when they were last used.
+        os.utime(path, None)
+        return entry
+
+    def save(self, key, entry):
+        """Store {switch name: (config, rt layout, routes)} under `key`. The
+        entry is written to a temporary directory and renamed into place, so
+        a concurrent run never reads half an entry.
+        """
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+        tmp = tempfile.mkdtemp(dir=self.directory, prefix=".tmp")
+        try:
+            for name, (config, _, _) in entry.items():
+                with open(os.path.join(tmp, name + ".click"), "w") as f:
+                    f.write(config)
+            with open(os.path.join(tmp, LAYOUTS), "w") as f:
+                json.dump(
+                    {name: layout for name, (_, layout, _) in entry.items()}, f
+                )
+            with open(os.path.join(tmp, ROUTES), "w") as f:
+                json.dump(
+                    {name: routes for name, (_, _, routes) in entry.items()}, f
+                )
+            os.rename(tmp, self.path(key))
+        except OSError:
+            # Another run saved the same key first.
+            shutil.rmtree(tmp, ignore_errors=True)
+        self.evict()
+
+    def evict(self):
+        """Remove the least recently used entries beyond max_entries."""
+        entries = [
+            self.path(key)
+            for key in os.listdir(self.directory)
+            if not key.startswith(".")
+        ]
+        entries.sort(key=os.path.getmtime, reverse=True)
+        for path in entries[self.max_entries :]:
+            shutil.rmtree(path, ignore_errors=True)
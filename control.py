@@ -0,0 +1,64 @@
+"""
+Client for Click's ControlSocket protocol, used to read and write handlers of
+a running user-level Click router (see `click --unix-socket`).
+"""
+import socket
+
+
+class ControlSocketError(Exception):
+    pass
+
+
+class ControlSocket(object):
+    def __init__(self, path, timeout=5.0):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        self.sock.connect(path)
+        self.f = self.sock.makefile("rb")
+        # Click greets each connection with "Click::ControlSocket/<version>".
+        greeting = self._readline()
+        if not greeting.startswith("Click::ControlSocket"):
+            raise ControlSocketError("unexpected greeting: " + greeting)
+
+    def _readline(self):
+        line = self.f.readline()
+        if not line:
+            raise ControlSocketError("connection closed")
+        return line.decode("ascii", "replace").rstrip("\r\n")
+
+    def _response(self, request):
+        # Responses may span several "CODE-message" lines and end with a
+        # "CODE message" line.
+        while True:
+            line = self._readline()
+            if line[3:4] != "-":
+                break
+        code = int(line[:3])
+        if code != 200:
+            raise ControlSocketError("{}: {}".format(request, line))
+        return line[4:]
+
+    def read(self, handler):
+        """Return the value of a read handler (e.g. "out0.drops")."""
+        self.sock.sendall("READ {}\r\n".format(handler).encode("ascii"))
+        self._response("READ " + handler)
+        # "DATA <length>" followed by exactly <length> bytes.
+        length = int(self._readline().split()[1])
+        return self.f.read(length).decode("ascii", "replace")
+
+    def write(self, handler, value=""):
+        """Call a write handler (e.g. "rt.add") with `value`."""
+        data = value.encode("ascii")
+        self.sock.sendall(
+            "WRITEDATA {} {}\r\n".format(handler, len(data)).encode("ascii")
+            + data
+        )
+        return self._response("WRITE " + handler)
+
+    def close(self):
+        try:
+            self.sock.sendall(b"QUIT\r\n")
+        except socket.error:
+            pass
+        self.f.close()
+        self.sock.close()
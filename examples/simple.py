@@ -21,6 +21,7 @@ from mininet.log import setLogLevel, info
 from click import ClickUserSwitch, ClickKernelSwitch
 import numpy as np
 import random
+import routing
 
 
 def parse_args():
@@ -133,10 +134,13 @@ def initialize_topology(adjacency_matrix, nodes_per_router=3, no_click=False):
     info("*** Adding hosts and switches\n")
     switches = []
     hosts = []
+    attached_hosts = []
     for j in xrange(num_routers):
         switches.append(net.addSwitch("s" + str(j)))
+        attached_hosts.append([])
         for i in xrange(nodes_per_router):
             hosts.append(net.addHost("h" + str(len(hosts))))
+            attached_hosts[-1].append(hosts[-1])
             net.addLink(hosts[-1], switches[-1])
 
     info("*** Adding router links\n")
@@ -159,10 +163,8 @@ def initialize_topology(adjacency_matrix, nodes_per_router=3, no_click=False):
     for s in switches:
         s.init_neighbors()
 
-    # Update the tables until convergence. (The number of iterations should be
-    # equal to the length of the longest path between routers.)
-    while any(s.update() for s in switches):
-        continue
+    # Add a shortest-path route to every other node.
+    routing.install_routes(switches, attached_hosts, adjacency_matrix)
 
     return net
 
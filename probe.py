@@ -0,0 +1,111 @@
+"""
+Latency probes between hosts with ping. Pings between many pairs run in
+parallel rather than one pair at a time (as in Mininet's pingAllFull), and
+can run alongside the traffic of an experiment.
+"""
+import collections
+import itertools
+import random
+import re
+
+import numpy as np
+
+# "sample": `pairs` random pairs of hosts; "all": every ordered pair, in
+# batches; "during": sampled pairs pinging for the length of the traffic
+# phase (see LatencyProbe.start).
+PROBE_MODES = ("sample", "all", "during")
+
+RTT_RE = re.compile(r"time=([\d.]+) ms")
+
+
+class LatencyProbe(object):
+    def __init__(
+        self,
+        hosts,
+        mode="sample",
+        pairs=None,
+        count=1,
+        interval=0.2,
+        batch=32,
+        duration=None,
+    ):
+        """Ping `count` times, every `interval` seconds, between each pair of
+        hosts. At most `batch` pings run at once. In "during" mode, the
+        pings are spread over `duration` seconds instead.
+        """
+        if mode not in PROBE_MODES:
+            raise NotImplementedError(mode)
+        self.mode = mode
+        self.interval = interval
+        self.batch = batch
+        if mode == "during":
+            assert duration, "during mode needs the traffic duration"
+            count = max(1, int(duration / interval))
+        self.count = count
+        self.pairs = list(itertools.permutations(hosts, 2))
+        if mode != "all":
+            self.pairs = random.sample(
+                self.pairs, min(len(self.pairs), pairs or len(hosts))
+            )
+        self.popens = []
+
+    def ping(self, src, dst):
+        return src.popen(
+            [
+                "ping",
+                "-c",
+                str(self.count),
+                "-i",
+                str(self.interval),
+                "-W",
+                "1",
+                dst.IP(),
+            ]
+        )
+
+    def start(self):
+        """In "during" mode, start pinging every pair now; otherwise
+        nothing happens until collect().
+        """
+        if self.mode == "during":
+            self.popens = [self.ping(src, dst) for src, dst in self.pairs]
+
+    def collect(self):
+        """Run the pings (or wait for the ones started by start()) and
+        return the round-trip times (ms) of every reply and the number of
+        pings sent.
+        """
+        if self.mode == "during":
+            outputs = [p.communicate()[0] for p in self.popens]
+        else:
+            outputs = []
+            for i in range(0, len(self.pairs), self.batch):
+                popens = [
+                    self.ping(src, dst)
+                    for src, dst in self.pairs[i : i + self.batch]
+                ]
+                outputs += [p.communicate()[0] for p in popens]
+        rtts = [
+            float(m.group(1))
+            for out in outputs
+            for m in RTT_RE.finditer(out.decode("ascii", "replace"))
+        ]
+        return np.array(rtts), self.count * len(self.pairs)
+
+
+def summarize(rtts, sent):
+    """RTT statistics (ms) of the replies to `sent` pings."""
+    summary = collections.OrderedDict()
+    summary["probes"] = sent
+    summary["probe_loss"] = 1 - float(len(rtts)) / sent if sent else None
+    for k, f in [
+        ("rtt_max", np.max),
+        ("rtt_min", np.min),
+        ("rtt_avg", np.mean),
+        ("rtt_std", np.std),
+    ]:
+        summary[k] = f(rtts) if len(rtts) else None
+    for q in (50, 99, 99.9):
+        k = "rtt_p{}".format(str(q).replace(".", ""))
+        summary[k] = np.percentile(rtts, q) if len(rtts) else None
+    return summary
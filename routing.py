@@ -0,0 +1,150 @@
+"""
+Route computation for a topology of routers.
+
+Routes are computed once from the router adjacency matrix rather than by
+flooding tables between switches until they converge.
+"""
+import numpy as np
+
+UNREACHABLE = -1
+
+
+def symmetric_adjacency(adjacency_matrix):
+    """Boolean adjacency matrix with both directions set and no self-links.
+    (The topology generators only fill in one direction for some layouts.)
+    """
+    adjacency = np.asarray(adjacency_matrix) != 0
+    adjacency = adjacency | adjacency.T
+    np.fill_diagonal(adjacency, False)
+    return adjacency
+
+
+def adjacency_from_edges(num_routers, edges):
+    """Boolean adjacency matrix of an edge list (see topology.py)."""
+    adjacency = np.zeros((num_routers, num_routers), dtype=bool)
+    if len(edges):
+        i, j = np.asarray(edges).T
+        adjacency[i, j] = adjacency[j, i] = True
+    return adjacency
+
+
+def shortest_path_lengths(adjacency):
+    """Hop count between every pair of routers, UNREACHABLE if there is no
+    path. Runs a BFS from every router at once: row i of `frontier` holds the
+    routers first reached from router i at the current distance.
+    """
+    n = adjacency.shape[0]
+    step = adjacency.astype(np.float32)
+    dist = np.full((n, n), UNREACHABLE, dtype=np.int32)
+    np.fill_diagonal(dist, 0)
+    reached = np.eye(n, dtype=bool)
+    frontier = reached
+    hops = 0
+    while frontier.any():
+        hops += 1
+        frontier = (frontier.astype(np.float32).dot(step) > 0) & ~reached
+        dist[frontier] = hops
+        reached |= frontier
+    return dist
+
+
+def shortest_path_neighbors(adjacency, dist, src):
+    """candidates[k, j] is True if k is a neighbor of router src that is one
+    hop closer to router j, i.e. k is an equal-cost next hop from src to j.
+    """
+    return adjacency[src][:, None] & (dist == dist[src] - 1)
+
+
+def next_hop_table(adjacency, dist):
+    """next_hop[i, j] is the lowest-numbered neighbor of router i on a
+    shortest path to router j, UNREACHABLE if j == i or j can't be reached.
+    """
+    n = adjacency.shape[0]
+    next_hop = np.full((n, n), UNREACHABLE, dtype=np.int32)
+    for src in range(n):
+        candidates = shortest_path_neighbors(adjacency, dist, src)
+        found = candidates.any(axis=0)
+        next_hop[src, found] = candidates.argmax(axis=0)[found]
+    return next_hop
+
+
+def equal_cost_next_hops(adjacency, dist, src):
+    """Map each router reachable from src to the sorted list of all of its
+    equal-cost next hops.
+    """
+    dsts, hops = np.nonzero(shortest_path_neighbors(adjacency, dist, src).T)
+    next_hops = {}
+    for dst, hop in zip(dsts.tolist(), hops.tolist()):
+        next_hops.setdefault(dst, []).append(hop)
+    return next_hops
+
+
+def install_routes(switches, attached_hosts, adjacency_matrix, multipath=False):
+    """Fill in every switch's routing table from a single shortest-path
+    computation. switches[i] is router i in the adjacency matrix and
+    attached_hosts[i] the hosts directly connected to it.
+
+    Each destination gets a list of next hops: every equal-cost next hop if
+    `multipath`, otherwise just the lowest-numbered one.
+    """
+    adjacency = symmetric_adjacency(adjacency_matrix)
+    dist = shortest_path_lengths(adjacency)
+    if multipath:
+        tables = [
+            equal_cost_next_hops(adjacency, dist, i)
+            for i in range(len(switches))
+        ]
+    else:
+        next_hop = next_hop_table(adjacency, dist)
+        tables = [
+            {j: [hop] for j, hop in enumerate(row) if hop != UNREACHABLE}
+            for row in next_hop.tolist()
+        ]
+    for s, table in zip(switches, tables):
+        routes = {}
+        for j, hops in table.items():
+            hops = [switches[k] for k in hops]
+            routes[switches[j]] = hops
+            for h in attached_hosts[j]:
+                routes[h] = hops
+        s.set_routes(routes)
+
+
+def prefix_mask(prefix_len):
+    return (0xFFFFFFFF << (32 - prefix_len)) & 0xFFFFFFFF
+
+
+def covering_prefix(addrs):
+    """The longest prefix, as (network, prefix length), that matches every
+    address in `addrs` (integers).
+    """
+    lo, hi = min(addrs), max(addrs)
+    prefix_len = 32 - (lo ^ hi).bit_length()
+    return lo & prefix_mask(prefix_len), prefix_len
+
+
+def collapse_prefixes(routes):
+    """Merge sibling prefixes that share an output port into their parent
+    prefix until no more merges are possible. `routes` and the result are
+    lists of (network, prefix length, port) with integer networks. Only
+    exact merges are made, so the result matches the same addresses as the
+    input.
+    """
+    by_len = [{} for _ in range(33)]
+    for net, prefix_len, port in routes:
+        by_len[prefix_len][net] = port
+    for prefix_len in range(32, 0, -1):
+        table, parents = by_len[prefix_len], by_len[prefix_len - 1]
+        bit = 1 << (32 - prefix_len)
+        for net, port in list(table.items()):
+            if net & bit or table.get(net | bit, port + 1) != port:
+                continue
+            if parents.get(net, port) != port:
+                continue
+            del table[net], table[net | bit]
+            parents[net] = port
+    return sorted(
+        (net, prefix_len, port)
+        for prefix_len, table in enumerate(by_len)
+        for net, port in table.items()
+    )
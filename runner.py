@@ -0,0 +1,184 @@
+#!/usr/bin/python
+"""
+Run a grid of experiments (start.py invocations), several at a time on one
+machine, and merge their results into one TSV.
+
+The spec is a JSON file:
+
+    {
+      "args": {"ttl": 5, "num_routers": 8, "run_experiment": true},
+      "grid": [
+        {"topology": ["single_switch", "star", "chain"]},
+        {"topology": ["random"], "sparsity": [0.25, 0.5]}
+      ],
+      "max_parallel": 4,
+      "cpus_per_run": 2
+    }
+
+Each entry of "grid" (or "grid" itself if it's one object) gives a run for
+every combination of its values, on top of "args". A true value is a flag
+and false leaves it out. Each run gets a unique name prefix for its nodes,
+its own CPUs (with taskset) and its own output file under output/runs.
+
+$ sudo python runner.py experiments.json
+"""
+import argparse
+import collections
+import itertools
+import json
+import multiprocessing
+import os
+import os.path
+import subprocess
+import sys
+import time
+
+# OpenFlow port of the first run's controller; run i gets CONTROLLER_PORT + i
+# so that concurrent runs never share one.
+CONTROLLER_PORT = 6653
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("spec")
+    parser.add_argument(
+        "--output",
+        default=None,
+        help="merged results (default: output/<spec name>.tsv)",
+    )
+    parser.add_argument("--max_parallel", type=int, default=None)
+    parser.add_argument("--cpus_per_run", type=int, default=None)
+    return parser.parse_args()
+
+
+def expand_grid(spec):
+    """List the start.py parameters of every run in the spec."""
+    grids = spec.get("grid", [{}])
+    if isinstance(grids, dict):
+        grids = [grids]
+    runs = []
+    for grid in grids:
+        keys = sorted(grid)
+        for values in itertools.product(*[grid[k] for k in keys]):
+            params = dict(spec.get("args", {}))
+            params.update(zip(keys, values))
+            runs.append(params)
+    return runs
+
+
+def command_line(params):
+    cmd = [sys.executable, "start.py"]
+    for k, v in sorted(params.items()):
+        if v is True:
+            cmd.append("--" + k)
+        elif v is not False and v is not None:
+            cmd += ["--" + k, str(v)]
+    return cmd
+
+
+def cpu_sets(cpus_per_run, max_parallel):
+    """Disjoint CPU lists for up to max_parallel runs at a time."""
+    cpus = multiprocessing.cpu_count()
+    slots = max(1, min(max_parallel, cpus // cpus_per_run))
+    return [
+        list(range(i * cpus_per_run, min(cpus, (i + 1) * cpus_per_run)))
+        for i in range(slots)
+    ]
+
+
+def run_all(runs, slots):
+    """Run every (name, params) in `runs` with at most one run per CPU set
+    in `slots` at a time. Returns the runs that failed.
+    """
+    free = list(slots)
+    pending = list(runs)
+    running = {}
+    failed = []
+    while pending or running:
+        while pending and free:
+            name, params = pending.pop(0)
+            cpus = free.pop(0)
+            cmd = ["taskset", "-c", ",".join(str(c) for c in cpus)]
+            cmd += command_line(params)
+            print("{} on cpus {}: {}".format(name, cpus, " ".join(cmd)))
+            with open("log/{}.out".format(name), "w") as log:
+                p = subprocess.Popen(cmd, stdout=log, stderr=subprocess.STDOUT)
+            running[p] = (name, cpus)
+        time.sleep(1)
+        for p, (name, cpus) in list(running.items()):
+            if p.poll() is not None:
+                del running[p]
+                free.append(cpus)
+                print("{} finished ({})".format(name, p.returncode))
+                if p.returncode:
+                    failed.append(name)
+    return failed
+
+
+def read_rows(fn):
+    with open(fn) as f:
+        lines = [l.rstrip("\n").split("\t") for l in f if l.strip()]
+    if not lines:
+        return []
+    return [collections.OrderedDict(zip(lines[0], l)) for l in lines[1:]]
+
+
+def merge(outputs, fn):
+    """Merge the TSVs of each run into fn, with a "run" column. Runs may
+    report different columns; missing values are left empty.
+    """
+    rows = []
+    for name, output in outputs:
+        if os.path.exists(output):
+            for row in read_rows(output):
+                rows.append(collections.OrderedDict([("run", name)]))
+                rows[-1].update(row)
+    keys = []
+    for row in rows:
+        keys += [k for k in row if k not in keys]
+    with open(fn, "w") as f:
+        f.write("\t".join(keys) + "\n")
+        for row in rows:
+            f.write("\t".join(str(row.get(k, "")) for k in keys) + "\n")
+    return len(rows)
+
+
+if __name__ == "__main__":
+    # Specs, logs and outputs are relative to the checkout.
+    os.chdir(os.path.abspath(os.path.dirname(sys.argv[0])))
+    args = parse_args()
+    with open(args.spec) as f:
+        spec = json.load(f)
+    max_parallel = args.max_parallel or spec.get("max_parallel", 1)
+    cpus_per_run = args.cpus_per_run or spec.get("cpus_per_run", 1)
+    if max_parallel > 1:
+        # There's only one kernel Click router per machine.
+        assert not any(
+            p.get("kernel") for p in expand_grid(spec)
+        ), "kernel runs can't share a machine"
+    for d in ("output/runs", "log"):
+        if not os.path.exists(d):
+            os.makedirs(d)
+
+    runs = []
+    outputs = []
+    for i, params in enumerate(expand_grid(spec)):
+        name = "r{}".format(i)
+        params["prefix"] = name
+        params["output"] = "output/runs/{}.tsv".format(name)
+        if os.path.exists(params["output"]):
+            os.remove(params["output"])
+        params["controller_port"] = CONTROLLER_PORT + i
+        runs.append((name, params))
+        outputs.append((name, params["output"]))
+
+    slots = cpu_sets(cpus_per_run, max_parallel)
+    print("{} runs, {} at a time".format(len(runs), len(slots)))
+    failed = run_all(runs, slots)
+
+    fn = args.output or "output/{}.tsv".format(
+        os.path.splitext(os.path.basename(args.spec))[0]
+    )
+    print("merged {} rows into {}".format(merge(outputs, fn), fn))
+    if failed:
+        print("failed: {} (see log/<run>.out)".format(", ".join(failed)))
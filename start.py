@@ -4,6 +4,8 @@ Create a topology with some nodes and a switch.
 """
 import argparse
 import collections
+import itertools
+import json
 import math
 import os
 import os.path
@@ -14,17 +16,20 @@ from string import Template
 import sys
 import time
 
-os.chdir(os.path.abspath(os.path.dirname(sys.argv[0])))
-
 from mininet.node import Controller, OVSSwitch
 from mininet.net import Mininet
 from mininet.log import setLogLevel, debug, info
 from mininet.link import TCLink
 from mininet.cli import CLI
-from mininet.util import pmonitor
+from mininet.util import ipStr, macColonHex, pmonitor
 import click
 from click import ClickUserSwitch, ClickKernelSwitch
+import configcache
 import numpy as np
+import probe
+import routing
+import topology
+import tracing
 import random
 
 
@@ -39,15 +44,251 @@ def parse_args():
     parser.add_argument("--num_routers", type=int, default=3)
     parser.add_argument("--nodes_per_router", type=int, default=3)
     parser.add_argument("--sparsity", type=float, default=None)
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=None,
+        help="seed for the random topology and the choice of host pairs "
+        "(default: a random seed, recorded with the results)",
+    )
+    parser.add_argument(
+        "--save_topology",
+        default=None,
+        help="save the topology (links, hosts and seed) to this JSON file",
+    )
+    parser.add_argument(
+        "--load_topology",
+        default=None,
+        help="run the topology saved with --save_topology instead of "
+        "generating one; overrides --topology, --num_routers, "
+        "--nodes_per_router, --sparsity and --seed",
+    )
+    parser.add_argument(
+        "--prefix",
+        default="",
+        help="prefix for switch and host names, unique per concurrent run",
+    )
+    parser.add_argument(
+        "--controller_port",
+        type=int,
+        default=None,
+        help="OpenFlow controller port (only --no_click networks have a "
+        "controller)",
+    )
+
+    # Configure the Click switches
+    parser.add_argument(
+        "--ecmp",
+        action="store_true",
+        help="hash flows across all equal-cost next hops",
+    )
+    parser.add_argument(
+        "--lookup",
+        default="StaticIPLookup",
+        choices=click.LOOKUP_ELEMENTS,
+        help="Click element used for the routing table",
+    )
+    parser.add_argument(
+        "--aggregate_routes",
+        action="store_true",
+        help="give each router a /24 for its hosts and route by prefix",
+    )
+    parser.add_argument(
+        "--arp",
+        default="tee",
+        choices=click.ARP_MODES,
+        help="how ARP requests reach the proxy ARP responders",
+    )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=1,
+        help="Click threads per switch; interfaces are spread across them",
+    )
+    parser.add_argument(
+        "--capture",
+        default="default",
+        choices=click.CAPTURE_METHODS,
+        help="how switches read packets from their interfaces: FromDevice "
+        "with its default, PCAP, LINUX or NETMAP method (user-level), or "
+        "PollDevice (--kernel)",
+    )
+    parser.add_argument(
+        "--batch_size",
+        type=int,
+        default=None,
+        help="packets moved per FromDevice/PollDevice and ToDevice run "
+        "(BURST)",
+    )
+    parser.add_argument(
+        "--fast_path",
+        action="store_true",
+        help="forward IP packets without stripping and re-adding the "
+        "Ethernet header, rewriting its addresses in place",
+    )
+    parser.add_argument(
+        "--no_checksum",
+        action="store_true",
+        help="don't verify IP header checksums",
+    )
+    parser.add_argument(
+        "--queue",
+        default=None,
+        help="output queue per port, as a comma-separated list of "
+        "KIND[:DEPTH] with KIND one of {} (the last entry applies to any "
+        "remaining ports)".format(", ".join(click.QUEUE_KINDS)),
+    )
+    parser.add_argument(
+        "--counters",
+        action="store_true",
+        help="count packets at each stage of every switch and save the "
+        "counts to <output>.counters.tsv after the run",
+    )
+    parser.add_argument(
+        "--trace_sample",
+        type=int,
+        default=0,
+        help="trace 1 in N IP packets (N a power of 2) through every switch",
+    )
+    parser.add_argument(
+        "--trace_filter",
+        default=None,
+        help="only trace packets matching this Click Classifier pattern "
+        "(e.g. 36/138d for UDP port 5005)",
+    )
+
+    # Start the Click switches
+    parser.add_argument(
+        "--batch_start",
+        action="store_true",
+        help="render the switch configs in parallel, launch every switch at "
+        "once and wait until all of them are running",
+    )
+    parser.add_argument(
+        "--config_cache",
+        action="store_true",
+        help="reuse the routes and configs of an identical earlier network "
+        "from {} (see configcache.py)".format(configcache.CACHE_DIR),
+    )
+    parser.add_argument(
+        "--config_cache_size",
+        type=int,
+        default=32,
+        help="networks kept in the config cache",
+    )
+    parser.add_argument(
+        "--config_workers",
+        type=int,
+        default=None,
+        help="processes rendering configs with --batch_start (default: one "
+        "per CPU)",
+    )
 
     # Run an experiment
     parser.add_argument("--run_experiment", action="store_true")
     parser.add_argument("--run_ping", action="store_true")
+    parser.add_argument(
+        "--traffic",
+        default="iperf",
+        choices=("iperf", "iperf_parallel", "udp"),
+        help="traffic for --run_experiment: iperf flows one at a time, iperf "
+        "flows all at once, or all senders at once with traffic/send.py",
+    )
     parser.add_argument("--output", default="output/results.txt")
     parser.add_argument("--ttl", help="ttl in seconds", type=int, default=3)
     parser.add_argument("--rate", help="k/sec", type=int, default=20)
     parser.add_argument("--size", help="bytes per packet", type=int, default=64)
     parser.add_argument("--udpBw", default="1000M")
+    parser.add_argument(
+        "--send_procs",
+        type=int,
+        default=1,
+        help="sender processes per host with --traffic udp",
+    )
+    parser.add_argument(
+        "--send_burst",
+        type=int,
+        default=32,
+        help="packets per sendmmsg call with --traffic udp",
+    )
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=0.1,
+        help="seconds between rate samples with --traffic udp",
+    )
+    parser.add_argument(
+        "--warmup",
+        type=float,
+        default=1.0,
+        help="seconds left out of steady-state rates with --traffic udp",
+    )
+    parser.add_argument(
+        "--rcvbuf",
+        type=int,
+        default=8 * 1024 * 1024,
+        help="receive socket buffer (bytes) with --traffic udp",
+    )
+    parser.add_argument(
+        "--fail_link",
+        default=None,
+        help="take down the link between routers I,J (e.g. 0,1) during the "
+        "run and reroute around it, recording how long rerouting takes",
+    )
+    parser.add_argument(
+        "--fail_after",
+        type=float,
+        default=1.0,
+        help="seconds into the run to fail --fail_link",
+    )
+
+    parser.add_argument(
+        "--probe",
+        default="all",
+        choices=probe.PROBE_MODES + ("none",),
+        help="measure RTTs between every pair of hosts or sampled pairs "
+        "after the traffic, or between sampled pairs during it",
+    )
+    parser.add_argument(
+        "--probe_pairs",
+        type=int,
+        default=None,
+        help="pairs of hosts to sample (default: one per host)",
+    )
+    parser.add_argument(
+        "--probe_count",
+        type=int,
+        default=1,
+        help="pings per pair after the traffic",
+    )
+
+    # Find the highest loss-free rate
+    parser.add_argument(
+        "--sweep",
+        action="store_true",
+        help="step the --traffic udp rate within one session to find the "
+        "no-drop rate and the knee point (see run_sweep)",
+    )
+    parser.add_argument("--sweep_min", help="k/sec", type=int, default=10)
+    parser.add_argument("--sweep_max", help="k/sec", type=int, default=1000)
+    parser.add_argument(
+        "--sweep_points",
+        type=int,
+        default=5,
+        help="evenly spaced rates tried before the binary search",
+    )
+    parser.add_argument(
+        "--sweep_steps",
+        type=int,
+        default=6,
+        help="binary search steps",
+    )
+    parser.add_argument(
+        "--loss_tolerance",
+        type=float,
+        default=0.0,
+        help="fraction of packets the network may lose at the no-drop rate",
+    )
 
     # Run the net in the CLI.
     parser.add_argument("--cli", action="store_true")
@@ -64,106 +305,43 @@ def parse_args():
     return args
 
 
-def adjacency_matrix_to_adjacency_list(adjacency_matrix):
-    assert adjacency_matrix.shape[0] == adjacency_matrix.shape[1]
-    assert np.array_equal(adjacency_matrix, adjacency_matrix.T)
-    adjacency_list = {}
-    for j in xrange(adjacency_matrix.shape[0]):
-        adjacency_list[j] = set(np.nonzero(adjacency_matrix[j, :])[0].tolist())
-    return adjacency_list
-
-
-def create_random_topology(num_routers, sparsity=0.15):
-    """Initialize a random topology with n routers and one node per
-    router; Ensures that the topology is connected by adding random
-    edges to a randomly sampled tree
-
-    Returns: Adjancency matrix of size N x N
+def switch_params(args):
+    """Parameters passed to every Click switch. They're also recorded with the
+    results of each run.
     """
-    frontier = []
-    frontier.append(0)
-    exterior = list(xrange(1, num_routers))
-    adjacency_matrix = np.zeros((num_routers, num_routers))
-    while len(exterior):
-        # randomly select a router in the frontier and the exterior;
-        # create an edge b/w them then update the frontier and
-        # exterior
-        sampled_exterior_router_id = random.randrange(len(exterior))
-        sampled_exterior_router = exterior[sampled_exterior_router_id]
-
-        sampled_frontier_router_id = random.randrange(len(frontier))
-        sampled_frontier_router = frontier[sampled_frontier_router_id]
-
-        # add edges; 2 edges for symmetry
-        adjacency_matrix[sampled_exterior_router, sampled_frontier_router] = 1
-        adjacency_matrix[sampled_frontier_router, sampled_exterior_router] = 1
-
-        # update frontier, exterior
-        exterior.pop(sampled_exterior_router_id)
-        frontier.append(sampled_exterior_router)
-
-    assert len(frontier) == num_routers
-    assert len(set(frontier)) == num_routers
-
-    # sample a random symmetric adjency matrix; append edges to the sampled tree
-    x_upper, y_upper = np.triu_indices(num_routers, 1)
-    random_adjacency_matrix = np.zeros((num_routers, num_routers))
-    edges = np.random.rand(len(x_upper)) < sparsity
-    random_adjacency_matrix[x_upper, y_upper] = edges
-    random_adjacency_matrix[y_upper, x_upper] = edges
-    random_adjacency_matrix[np.arange(num_routers), np.arange(num_routers)] = 1
-
-    print("number of edges in tree", np.sum(adjacency_matrix) // 2)
-    print("number of sparse edges", np.sum(random_adjacency_matrix) // 2)
-    return (adjacency_matrix + random_adjacency_matrix) >= 1
-
-
-def create_single_switch_topology(num_routers):
-    return np.ones((1, 1))
-
-
-def create_star_topology(num_routers):
-    """Every router is connect by a single central router"""
-    adjacency_matrix = np.zeros((num_routers + 1, num_routers + 1))
-    center = num_routers
-    for i in xrange(num_routers):
-        adjacency_matrix[i][center] = 1
-    print(adjacency_matrix)
-    return adjacency_matrix
-
-
-def create_chain_topology(num_routers):
-    adjacency_matrix = np.zeros((num_routers, num_routers))
-    for i in xrange(1, num_routers):
-        adjacency_matrix[i - 1][i] = 1
-    return adjacency_matrix
-
-
-def create_ring_topology(num_routers):
-    pass
+    return collections.OrderedDict(
+        [
+            ("ecmp", bool(args.ecmp)),
+            ("lookup", args.lookup or "StaticIPLookup"),
+            ("aggregate_routes", bool(args.aggregate_routes)),
+            ("arp", args.arp or "tee"),
+            ("threads", args.threads or 1),
+            ("capture", args.capture or "default"),
+            ("fast_path", bool(args.fast_path)),
+            ("verify_checksum", not args.no_checksum),
+            ("batch_size", args.batch_size),
+            ("queue", args.queue),
+            ("counters", bool(args.counters)),
+            ("trace_sample", args.trace_sample or 0),
+            ("trace_filter", args.trace_filter),
+        ]
+    )
 
 
-def create_bottleneck_topology(num_routers):
+def router_subnet(j):
+    """The /24 holding the hosts of router j when routes are aggregated
+    (10.0.0.0/24 for router 0, 10.0.1.0/24 for router 1, and so on).
+    Consecutive routers get sibling subnets so they can be merged.
     """
-    h0            h5
-    h1 s0  s2  s3 h6
-    h2 s1      s4 h7
-    h3            h8
-    """
-    pass
+    return 0x0A000000 + (j << 8), 24
 
 
-def initialize_topology(args, adjacency_matrix):
+def initialize_topology(args, spec):
     """
-    Initialize topology of routers defined by an adjancency matrix
-    Add args.nodes_per_router nodes to each router.
+    Initialize the topology of a spec (see topology.create_spec): its routers,
+    linked by its edges, each with its number of hosts attached.
     """
-    assert adjacency_matrix.shape[0] == adjacency_matrix.shape[1]
-    if args.topology == "single_switch":
-        num_routers = 1
-        nodes_per_router = args.num_routers * args.nodes_per_router
-    else:
-        num_routers, nodes_per_router = args.num_routers, args.nodes_per_router
+    num_switches, edges = spec["num_switches"], spec["edges"]
 
     if args.no_click:
         switch = OVSSwitch
@@ -173,33 +351,62 @@ def initialize_topology(args, adjacency_matrix):
         switch = ClickUserSwitch
 
     net = Mininet(switch=switch, link=TCLink)
+    # Node names (and so interface names) start with the prefix, so that
+    # several networks can run on one machine (see runner.py).
+    prefix = args.prefix or ""
+    if args.no_click:
+        params = {}
+    else:
+        params = switch_params(args)
+        params["batch"] = bool(args.batch_start)
 
-    info("*** Adding controller\n")
-    net.addController("c0")
+    # Click switches forward on their own configs; only Open vSwitch needs
+    # a controller.
+    if args.no_click:
+        info("*** Adding controller\n")
+        if args.controller_port:
+            net.addController("c0", port=args.controller_port)
+        else:
+            net.addController("c0")
 
     info("*** Adding hosts and switches\n")
     switches = []
     hosts = []
-    for j in xrange(adjacency_matrix.shape[0]):
-        switches.append(net.addSwitch("s" + str(j)))
+    attached_hosts = []
+    if args.aggregate_routes:
+        assert max(spec["hosts"]) < 255
+    # Give interfaces the same MACs every run, so that a network's configs
+    # are too (see configcache.py).
+    macs = (macColonHex(0x020000000000 + i) for i in itertools.count(1))
+    for j in xrange(num_switches):
         # Star topology has one router that isn't connected to any hosts.
-        if j < num_routers:
-            for i in xrange(nodes_per_router):
-                hosts.append(net.addHost("h" + str(len(hosts))))
-                net.addLink(hosts[-1], switches[-1])
+        has_hosts = spec["hosts"][j] > 0
+        opts = dict(params)
+        if args.aggregate_routes and has_hosts:
+            net_num, prefix_len = router_subnet(j)
+            if not args.no_click:
+                opts["subnet"] = "{}/{}".format(ipStr(net_num), prefix_len)
+        switches.append(net.addSwitch(prefix + "s" + str(j), **opts))
+        attached_hosts.append([])
+        if has_hosts:
+            for i in xrange(spec["hosts"][j]):
+                name = prefix + "h" + str(len(hosts))
+                if args.aggregate_routes:
+                    # Keep the /8 so hosts still ARP for every other host.
+                    ip = "{}/8".format(ipStr(net_num + i + 1))
+                    hosts.append(net.addHost(name, ip=ip))
+                else:
+                    hosts.append(net.addHost(name))
+                attached_hosts[-1].append(hosts[-1])
+                net.addLink(
+                    hosts[-1], switches[-1], addr1=next(macs), addr2=next(macs)
+                )
 
     info("*** Adding router links\n")
-    router_router_links = []
-    added = set([])
-    # We don't want to add self-links or duplicates.
-    for row in xrange(len(adjacency_matrix)):
-        for col in xrange(len(adjacency_matrix[row])):
-            if row == col or adjacency_matrix[row][col] == 0:
-                continue
-            i, j = sorted([row, col])
-            if (i, j) not in added:
-                added.add((i, j))
-                net.addLink(switches[i], switches[j])
+    for i, j in edges.tolist():
+        net.addLink(
+            switches[i], switches[j], addr1=next(macs), addr2=next(macs)
+        )
 
     if args.no_click:
         return net
@@ -208,14 +415,56 @@ def initialize_topology(args, adjacency_matrix):
     for s in switches:
         s.init_neighbors()
 
-    # Update the tables until convergence. (The number of iterations should be
-    # equal to the length of the longest path between routers.)
-    while any(s.update() for s in switches):
-        continue
+    if args.config_cache:
+        cache = configcache.ConfigCache(max_entries=args.config_cache_size)
+        key = configcache.cache_key(config_cache_fields(args, switch, spec))
+        entry = cache.load(key)
+        if entry:
+            # Restoring the routes is much cheaper than computing them, and
+            # keeps node_table and multipath right for a later reconfigure.
+            info("*** Using cached configs {}\n".format(key))
+            nodes = {n.name: n for n in switches + hosts}
+            for s in switches:
+                config, layout, routes = entry[s.name]
+                s.cached = (config, layout)
+                s.restore_routes(routes, nodes)
+            return net
+
+    # Add a shortest-path route to every other node.
+    routing.install_routes(
+        switches,
+        attached_hosts,
+        routing.adjacency_from_edges(num_switches, edges),
+        multipath=args.ecmp,
+    )
+
+    if args.config_cache:
+        info("*** Caching configs {}\n".format(key))
+        configs = click.render_configs(switches)
+        entry = {}
+        for s, config in zip(switches, configs):
+            layout = s.port_layout() if s.switch_type == "router" else None
+            s.cached = (config, layout)
+            entry[s.name] = (config, layout, s.saved_routes())
+        cache.save(key, entry)
 
     return net
 
 
+def config_cache_fields(args, switch, spec):
+    """Everything the configs of a network depend on, besides the code."""
+    return {
+        "switch": switch.__name__,
+        "prefix": args.prefix or "",
+        "num_switches": spec["num_switches"],
+        "hosts": spec["hosts"],
+        "edges": spec["edges"].tolist(),
+        "params": switch_params(args),
+        # Debug configs keep their Print elements (see ClickConfig.router).
+        "debug": click.debug,
+    }
+
+
 class dotdict(dict):
     """dot.notation access to dictionary attributes"""
 
@@ -227,17 +476,23 @@ class dotdict(dict):
 def get_net(args):
     if type(args) == dict:
         args = dotdict(args)
-    if args.topology == "single_switch":
-        topo = create_single_switch_topology(1)
-    elif args.topology == "star":
-        topo = create_star_topology(args.num_routers)
-    elif args.topology == "chain":
-        topo = create_chain_topology(args.num_routers)
-    elif args.topology == "random":
-        topo = create_random_topology(args.num_routers, args.sparsity)
+    if args.load_topology:
+        spec = topology.load_spec(args.load_topology)
+        # Record the loaded topology's parameters with the results.
+        for k in ("topology", "num_routers", "nodes_per_router", "sparsity"):
+            setattr(args, k, spec[k])
     else:
-        raise NotImplementedError(args.topology)
-    return initialize_topology(args, topo)
+        spec = topology.create_spec(
+            args.topology,
+            args.num_routers,
+            args.nodes_per_router,
+            args.sparsity,
+            args.seed,
+        )
+    args.seed = spec["seed"]
+    if args.save_topology:
+        topology.save_spec(args.save_topology, spec)
+    return initialize_topology(args, spec)
 
 
 def cleanup():
@@ -263,13 +518,17 @@ def print_rows(rows):
     return s
 
 
-def run_experiment(args, net):
+def run_experiment(args, net, poll=None):
     # Partition hosts into senders and receivers.
     hosts = net.hosts
     assert len(hosts) % 2 == 0
     senders, receivers = hosts[: len(hosts) / 2], hosts[len(hosts) / 2 :]
     out = []
     for sender, receiver in zip(senders, receivers):
+        # The flows run one at a time, so `poll` only gets a look in
+        # between them.
+        if poll:
+            poll()
         out.append(
             net.iperf(
                 [sender, receiver],
@@ -288,72 +547,243 @@ def run_experiment(args, net):
     summary["sent"] = sum(sent for sent, _ in vals)
     summary["received"] = sum(recv for _, recv in vals)
     summary["fwd_rate"] = float(summary["received"]) / summary["sent"]
+    return summary
+
 
-    pings = net.pingAllFull()
-    ping_vals = [result[2] for _, _, result in pings]
-    summary["rtt_max"] = max(ping_vals)
-    summary["rtt_min"] = min(ping_vals)
-    summary["rtt_avg"] = np.mean(ping_vals)
-    summary["rtt_std"] = np.std(ping_vals)
+# Fields of iperf's CSV (-y C) UDP reports. Clients print their own report
+# (the first 9 fields) and then the server's report of what arrived.
+IPERF_CSV_FIELDS = (
+    "timestamp",
+    "src_ip",
+    "src_port",
+    "dst_ip",
+    "dst_port",
+    "id",
+    "interval",
+    "bytes",
+    "bps",
+    "jitter_ms",
+    "lost",
+    "total",
+    "lost%",
+    "out_of_order",
+)
+
+
+def run_parallel_iperf(args, net, poll=None):
+    """Like run_experiment, but every iperf flow runs at the same time, so
+    the flows contend for the switches and the run takes args.ttl seconds
+    however many flows there are.
+    """
+    # Partition hosts into senders and receivers.
+    hosts = net.hosts
+    assert len(hosts) % 2 == 0
+    senders, receivers = hosts[: len(hosts) / 2], hosts[len(hosts) / 2 :]
+    servers = {r: r.popen(["iperf", "-s", "-u", "-y", "C"]) for r in receivers}
+    # Give the servers a moment to bind before the clients send.
+    time.sleep(1)
+    print("starting %d iperf flows" % len(senders))
+    clients = {
+        s: s.popen(
+            [
+                "iperf",
+                "-c",
+                r.IP(),
+                "-u",
+                "-b",
+                args.udpBw,
+                "-t",
+                str(args.ttl),
+                "-y",
+                "C",
+            ]
+        )
+        for s, r in zip(senders, receivers)
+    }
+    end_at = time.time() + args.ttl + 5
+    reports = {s: [] for s in senders}
+    for h, line in pmonitor(clients, timeoutms=500):
+        debug("%s: '%s'\n" % (str(h), line.strip()))
+        if h and line.strip():
+            reports[h].append(
+                dict(zip(IPERF_CSV_FIELDS, line.strip().split(",")))
+            )
+        if poll:
+            poll()
+        if time.time() > end_at:
+            break
+    for p in list(clients.values()) + list(servers.values()):
+        p.send_signal(SIGINT)
+
+    rows = []
+    for s, r in zip(senders, receivers):
+        client = [rep for rep in reports[s] if "jitter_ms" not in rep]
+        server = [rep for rep in reports[s] if "jitter_ms" in rep]
+        if not client:
+            print("no iperf report from %s" % s.name)
+            continue
+        sent = float(client[-1]["bps"]) / 1e6
+        received = float(server[-1]["bps"]) / 1e6 if server else 0.0
+        rows.append(
+            collections.OrderedDict(
+                [
+                    ("src", s.name),
+                    ("dst", r.name),
+                    ("sent", sent),
+                    ("received", received),
+                    ("lost", int(server[-1]["lost"]) if server else None),
+                    ("total", int(server[-1]["total"]) if server else None),
+                    (
+                        "jitter_ms",
+                        float(server[-1]["jitter_ms"]) if server else None,
+                    ),
+                ]
+            )
+        )
+    if not rows:
+        # Nothing to report: fail the run rather than record zero rates.
+        raise RuntimeError("no iperf flow reported (is iperf installed?)")
+    print_rows(rows)
+    # Rates are in Mbits/sec.
+    summary = collections.OrderedDict()
+    summary["sent"] = sum(row["sent"] for row in rows)
+    summary["received"] = sum(row["received"] for row in rows)
+    summary["fwd_rate"] = (
+        float(summary["received"]) / summary["sent"] if summary["sent"] else 0.0
+    )
     return summary
 
 
-def _run_experiment(args, net):
+def run_udp_experiment(args, net, poll=None):
+    """Send UDP packets (traffic/send.py) from half of the hosts to the other
+    half at args.rate k/sec in total, counting what arrives
+    (traffic/receive.py).
+    """
+    # Partition hosts into senders and receivers.
+    hosts = net.hosts
+    assert len(hosts) % 2 == 0
+    senders, receivers = hosts[: len(hosts) / 2], hosts[len(hosts) / 2 :]
     rcmd_t = Template(
         "python -u traffic/receive.py --ip $ip --ttl $ttl --size $size "
-        "--log '/home/mininet/mininet-click/log/$h-r.log'"
+        "--rcvbuf $rcvbuf --interval $interval "
+        "--log log/$h-r.log"
     )
     scmd_t = Template(
         "python -u traffic/send.py --ip $ip --ttl $ttl --size $size "
-        "--rate $rate --log '/home/mininet/mininet-click/log/$h-s.log'"
+        "--rate $rate --procs $procs --burst $burst --interval $interval "
+        "--stream $stream "
+        "--log log/$h-s.log"
     )
     print("ttl: %d, rate: %dk, size: %d" % (args.ttl, args.rate, args.size))
     print("starting %d flows" % len(senders))
+    start = time.time()
     popens = {}
-    for s, r in zip(senders, receivers):
+    for i, (s, r) in enumerate(zip(senders, receivers)):
         debug("sender: %s, receiver: %s (%s)\n" % (s.name, r.name, r.IP()))
         rcmd = rcmd_t.substitute(
             ip=r.IP(),
             ttl=args.ttl,
             size=args.size,
-            rate=args.rate / len(senders),
+            rcvbuf=args.rcvbuf,
+            interval=args.interval,
             h=r.name,
         ).split(" ")
         scmd = scmd_t.substitute(
             ip=r.IP(),
             ttl=args.ttl,
             size=args.size,
-            rate=args.rate / len(senders),
+            rate=float(args.rate) / len(senders),
+            procs=args.send_procs,
+            burst=args.send_burst,
+            interval=args.interval,
+            stream=i,
             h=s.name,
         ).split(" ")
         popens[r] = r.popen(rcmd)
         popens[s] = s.popen(scmd)
     print("monitoring for %d seconds" % (args.ttl + 3))
     end_at = time.time() + args.ttl + 3
-    results = {h: 0 for h in hosts}
-    cur = None
+    results = {h: {"sent": 0, "rate": 0.0} for h in senders}
+    results.update({h: {"received": 0, "socket_drops": 0} for h in receivers})
+    # Both tools print a progress record with the count so far every
+    # interval, then a summary.
+    progress = {h: [] for h in hosts}
     for h, line in pmonitor(popens, timeoutms=500):
         debug("%s: '%s'\n" % (str(h), line.strip()))
         if h and line.strip():
-            results[h] = int(line.strip())
+            record = json.loads(line)
+            if "time" in record:
+                progress[h].append(record)
+            else:
+                results[h] = record
+        if poll:
+            poll()
         if time.time() > end_at:
             break
     for p in popens.values():
         p.send_signal(SIGINT)
+
+    # Rates over the run in each interval, per flow. Steady-state rates
+    # leave out the first args.warmup seconds and the last interval, in
+    # which the tools stop.
+    grid = start + np.arange(0, args.ttl + args.interval / 2, args.interval)
+    series = collections.OrderedDict(
+        [
+            ("sent", [resample(progress[s], "sent", grid) for s in senders]),
+            (
+                "received",
+                [resample(progress[r], "received", grid) for r in receivers],
+            ),
+            (
+                "socket_drops",
+                [
+                    resample(progress[r], "socket_drops", grid)
+                    for r in receivers
+                ],
+            ),
+        ]
+    )
+    steady = slice(
+        min(int(round(args.warmup / args.interval)), len(grid) - 3), -1
+    )
+    series_fn = write_time_series(
+        args,
+        [(s.name, r.name) for s, r in zip(senders, receivers)],
+        grid - start,
+        series,
+    )
+
     rows = []
-    for s, r in zip(senders, receivers):
+    for i, (s, r) in enumerate(zip(senders, receivers)):
         assert s in results and r in results
-        sent = results[s]
-        received = results[r]
+        sent = results[s]["sent"]
+        received = results[r]["received"]
+        # Packets dropped at the receiver's socket aren't network drops.
+        socket_drops = results[r]["socket_drops"]
+        lost = sent - received - socket_drops
+        # One-way latency under load (see traffic/measure.py).
+        latency = results[r].get("latency_us", {})
         d = collections.OrderedDict(
             [
                 ("src", s.name),
                 ("dst", r.name),
                 ("s", sent),
                 ("s/s", sent / args.ttl),
+                ("sent k/s", results[s]["rate"]),
+                ("steady s k/s", series["sent"][i][steady].mean() / 1000.0),
+                (
+                    "steady r k/s",
+                    series["received"][i][steady].mean() / 1000.0,
+                ),
                 ("r", received),
                 ("r/s", received / args.ttl),
-                ("drop%", int(100 * (1 - (float(received) / sent)))),
+                ("rcv drops", socket_drops),
+                ("drop%", int(100 * float(lost) / sent) if sent else 0),
+                ("p50 us", latency.get("p50")),
+                ("p99 us", latency.get("p99")),
+                ("reordered", results[r].get("reordered", 0)),
+                ("dups", results[r].get("duplicates", 0)),
+                ("loss bursts", results[r].get("loss_bursts", 0)),
             ]
         )
         rows.append(d)
@@ -362,16 +792,47 @@ def _run_experiment(args, net):
     summary["rate"] = str(args.rate) + "k"
     keys = list(rows[0].keys())
     for k in keys:
-        if type(rows[0][k]) != str:
+        if k.endswith(" us"):
+            # The slowest flow's latency.
+            summary[k] = max(
+                [row[k] for row in rows if row[k] is not None] or [None]
+            )
+        elif type(rows[0][k]) != str:
             summary[k] = sum(row[k] for row in rows)
             if "%" in k:
                 summary[k] /= float(len(rows))
+    summary["series"] = series_fn
     print("-" * 80)
     print_rows([summary])
     return summary
 
 
-def run_ping(args, net):
+def resample(records, key, grid):
+    """Rate (per second) of the cumulative count `key` of progress records
+    in each interval between the times in `grid`.
+    """
+    if not records:
+        return np.zeros(len(grid) - 1)
+    times = np.array([record["time"] for record in records])
+    counts = np.array([record[key] for record in records], dtype=float)
+    cumulative = np.interp(grid, times, counts, left=0.0)
+    return np.diff(cumulative) / np.diff(grid)
+
+
+def write_time_series(args, flows, times, series):
+    """Save per-flow rates over a run as <output>-<run id>.npz: `flows` holds
+    the (src, dst) pairs, `time` the end of each interval (s) and each array
+    in `series` a row of rates per flow. Returns the file name.
+    """
+    fn = "{}-{}.npz".format(
+        os.path.splitext(args.output)[0], time.strftime("%Y%m%d-%H%M%S")
+    )
+    arrays = {k: np.array(v) for k, v in series.items()}
+    np.savez_compressed(fn, flows=np.array(flows), time=times[1:], **arrays)
+    return fn
+
+
+def run_ping(args, net, poll=None):
     hosts = net.hosts[::]
     random.shuffle(hosts)  # Pick random pairs of hosts
     assert len(hosts) % 2 == 0
@@ -392,6 +853,8 @@ def run_ping(args, net):
         debug("%s: '%s'\n" % (str(h), line.strip()))
         if h and line.strip():
             results[h] = line.strip()
+        if poll:
+            poll()
         if time.time() > end_at:
             break
     for p in popens.values():
@@ -416,31 +879,245 @@ def run_ping(args, net):
     return summary
 
 
-def run(args, net):
-    summary = (
-        run_ping(args, net) if args.run_ping else run_experiment(args, net)
+def reroute(args, net):
+    """Recompute every switch's routes from the router links that are up and
+    apply them to the running switches (see ClickSwitch.update_routes).
+    Returns the number of routes changed in place; switches whose whole
+    config was swapped aren't counted.
+    """
+    switches = net.switches
+    index = {s.name: j for j, s in enumerate(switches)}
+    adjacency_matrix = np.zeros((len(switches), len(switches)))
+    attached_hosts = [[] for _ in switches]
+    for j, s in enumerate(switches):
+        for l in s.links():
+            intf = l.intf1 if l.intf1.node != s else l.intf2
+            if intf.node.name not in index:
+                attached_hosts[j].append(intf.node)
+            elif l.intf1.isUp() and l.intf2.isUp():
+                adjacency_matrix[j, index[intf.node.name]] = 1
+        s.init_neighbors()
+    routing.install_routes(
+        switches, attached_hosts, adjacency_matrix, multipath=args.ecmp
     )
+    return sum(s.update_routes() or 0 for s in switches)
+
+
+def fail_link(args, net, report):
+    """Take down the link in args.fail_link and reroute around it, adding
+    the time from the link going down until every switch has its new routes
+    to `report`.
+    """
+    i, j = [int(k) for k in args.fail_link.split(",")]
+    start = time.time()
+    prefix = args.prefix or ""
+    net.configLinkStatus(prefix + "s" + str(i), prefix + "s" + str(j), "down")
+    report["routes_changed"] = reroute(args, net)
+    report["reroute_s"] = time.time() - start
+
+
+class LinkFailure(object):
+    """Fails args.fail_link args.fail_after seconds after it's created.
+    Mininet drives each node through a single shell, so the failure can't
+    run on a thread of its own: the experiments call poll() from their
+    monitoring loops on the main thread, and finish() fails the link once
+    the traffic is done if that hasn't happened yet.
+    """
+
+    def __init__(self, args, net):
+        self.args = args
+        self.net = net
+        self.start = time.time()
+        self.report = collections.OrderedDict([("failed_link", args.fail_link)])
+        self.failed = False
+
+    def poll(self):
+        if self.failed or time.time() - self.start < self.args.fail_after:
+            return
+        self.failed = True
+        # Later than fail_after by up to a monitoring interval.
+        self.report["failed_after_s"] = time.time() - self.start
+        fail_link(self.args, self.net, self.report)
+
+    def finish(self):
+        if not self.failed:
+            time.sleep(max(0, self.start + self.args.fail_after - time.time()))
+            self.poll()
+
+
+def run_params(args):
+    """The topology and switch parameters recorded with each run."""
+    num_routers, nodes_per_router = args.num_routers, args.nodes_per_router
     if args.topology == "single_switch":
-        args.nodes_per_router = args.nodes_per_router * args.num_routers
-        args.num_routers = 1
+        num_routers, nodes_per_router = 1, nodes_per_router * num_routers
     report = collections.OrderedDict(
         [
             ("topology", args.topology),
             ("sparsity", args.sparsity),
-            ("num_routers", args.num_routers),
-            ("nodes_per_router", args.nodes_per_router),
+            ("seed", args.seed),
+            ("num_routers", num_routers),
+            ("nodes_per_router", nodes_per_router),
         ]
     )
+    report.update(switch_params(args))
+    return report
+
+
+def run(args, net):
+    latency_probe = None
+    if args.probe != "none":
+        latency_probe = probe.LatencyProbe(
+            net.hosts,
+            mode=args.probe,
+            pairs=args.probe_pairs,
+            count=args.probe_count,
+            duration=args.ttl,
+        )
+        latency_probe.start()
+    failure = LinkFailure(args, net) if args.fail_link else None
+    poll = failure.poll if failure else None
+    if args.run_ping:
+        summary = run_ping(args, net, poll)
+    elif args.traffic == "udp":
+        summary = run_udp_experiment(args, net, poll)
+    elif args.traffic == "iperf_parallel":
+        summary = run_parallel_iperf(args, net, poll)
+    else:
+        summary = run_experiment(args, net, poll)
+    if failure:
+        failure.finish()
+    report = run_params(args)
     report.update(summary)
+    if latency_probe:
+        report.update(probe.summarize(*latency_probe.collect()))
+    if failure:
+        report.update(failure.report)
+    if args.counters:
+        report["queue_drops"] = write_counters(args, net)
+    if args.trace_sample or args.trace_filter:
+        paths = tracing.collect([s.log_file for s in click_switches(net)])
+        for k, v in tracing.summarize(tracing.path_latencies(paths)).items():
+            report["trace_" + k] = v
     s = print_rows(report)
-    empty = os.stat(args.output).st_size == 0
-    with open(args.output, "a") as f:
+    append_rows(args.output, [report])
+
+
+def run_sweep(args, net):
+    """Step the offered load of the UDP experiment within one session: first
+    args.sweep_points evenly spaced rates up to args.sweep_max, then a binary
+    search for the highest rate at which the network loses at most
+    args.loss_tolerance of the packets (the RFC 2544 no-drop rate when 0).
+    Every trial is a row of args.output, with the sweep's no-drop rate and
+    knee point.
+    """
+    trials = []
+
+    def trial(rate, phase):
+        args.rate = rate
+        summary = run_udp_experiment(args, net)
+        sent = summary["s"]
+        lost = sent - summary["r"] - summary["rcv drops"]
+        loss = float(lost) / sent if sent else 1.0
+        # If the senders can't offer the rate, the trial says nothing about
+        # the network at that rate.
+        sender_limited = summary["sent k/s"] < 0.95 * rate
+        row = run_params(args)
+        row["phase"] = phase
+        row["offered k/s"] = rate
+        row["loss"] = loss
+        row["sender_limited"] = sender_limited
+        row.update(summary)
+        trials.append(row)
+        return loss <= args.loss_tolerance and not sender_limited
+
+    passed = 0
+    failed = None
+    for rate in np.linspace(args.sweep_min, args.sweep_max, args.sweep_points):
+        rate = int(round(rate))
+        if trial(rate, "scan"):
+            passed = rate
+        elif failed is None:
+            failed = rate
+            break
+    if failed is not None:
+        for _ in range(args.sweep_steps):
+            rate = (passed + failed) // 2
+            if rate <= passed:
+                break
+            if trial(rate, "search"):
+                passed = rate
+            else:
+                failed = rate
+
+    knee = knee_point(
+        [(row["offered k/s"], row["steady r k/s"]) for row in trials]
+    )
+    for row in trials:
+        row["no_drop k/s"] = passed or None
+        row["knee k/s"] = knee
+    print("-" * 80)
+    print("no-drop rate: {}k/s, knee: {}k/s".format(passed or None, knee))
+    append_rows(args.output, trials)
+
+
+def knee_point(points, slope=0.5):
+    """The offered load after which the forwarding rate grows by less than
+    `slope` per unit of extra offered load, from (offered, forwarded)
+    points.
+    """
+    points = sorted(points)
+    for (o1, f1), (o2, f2) in zip(points, points[1:]):
+        if o2 > o1 and float(f2 - f1) / (o2 - o1) < slope:
+            return o1
+    return points[-1][0] if points else None
+
+
+def append_rows(fn, rows):
+    """Append rows to a TSV file, writing the header if the file is empty."""
+    empty = not os.path.exists(fn) or os.stat(fn).st_size == 0
+    with open(fn, "a") as f:
         if empty:
-            f.write("\t".join(list(report.keys())) + "\n")
-        f.write("\t".join([str(v) for v in report.values()]) + "\n")
+            f.write("\t".join(list(rows[0].keys())) + "\n")
+        for row in rows:
+            f.write("\t".join([str(v) for v in row.values()]) + "\n")
+
+
+def click_switches(net):
+    return [s for s in net.switches if isinstance(s, click.ClickSwitch)]
+
+
+def write_counters(args, net):
+    """Append a snapshot of every switch's counters and queue statistics to
+    <output>.counters.tsv (one row per element handler) and return the total
+    number of packets dropped by queues.
+    """
+    run_id = time.strftime("%Y%m%d-%H%M%S")
+    rows = []
+    # Only Click switches have counters (not --no_click's OVS switches).
+    for s in click_switches(net):
+        for element, values in s.read_counters().items():
+            for handler, value in values.items():
+                rows.append(
+                    collections.OrderedDict(
+                        [
+                            ("run", run_id),
+                            ("switch", s.name),
+                            ("element", element),
+                            ("handler", handler),
+                            ("value", value),
+                        ]
+                    )
+                )
+    if rows:
+        append_rows(os.path.splitext(args.output)[0] + ".counters.tsv", rows)
+    return sum(row["value"] for row in rows if row["handler"] == "drops")
 
 
 if __name__ == "__main__":
+    # Paths (config/, log/, output/, traffic/) are relative to the checkout.
+    # Only when run as a script, so that importing this module (e.g. from
+    # benchmarks/) leaves the working directory alone.
+    os.chdir(os.path.abspath(os.path.dirname(sys.argv[0])))
     args = parse_args()
     if args.cleanup:
         cleanup()
@@ -448,15 +1125,18 @@ if __name__ == "__main__":
     print("Params: {}".format(vars(args)))
     setLogLevel(args.log_level)
     click.debug = args.log_level == "debug"
+    click.config_workers = args.config_workers
 
     net = get_net(args)
+    # Host pairs are drawn with `random`: the same seed, the same pairs.
+    random.seed(args.seed)
 
     info("*** Starting network\n")
     net.start()
 
-    if args.run_experiment or args.run_ping:
+    if args.run_experiment or args.run_ping or args.sweep:
         try:
-            run(args, net)
+            run_sweep(args, net) if args.sweep else run(args, net)
         except Exception:
             net.stop()
             raise
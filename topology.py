@@ -0,0 +1,195 @@
+"""
+Topology generators. Each returns the number of routers and the links between
+them as an edge list: an (E, 2) integer array of router pairs (i, j), i < j,
+without duplicates. Nothing is O(N^2) in the number of routers N unless the
+topology itself has that many links. Random topologies draw from `rng`, a
+numpy RandomState (by default numpy's global one).
+
+A spec (see create_spec) adds the hosts attached to each router and the seed,
+and can be saved and loaded to replay the same network.
+"""
+import collections
+import json
+
+import numpy as np
+
+TOPOLOGIES = ("single_switch", "star", "chain", "random")
+
+
+def no_edges():
+    return np.zeros((0, 2), dtype=np.int64)
+
+
+def normalize_edges(num_routers, edges):
+    """Sort each pair, drop self-links and duplicates and sort the pairs."""
+    edges = np.sort(np.asarray(edges, dtype=np.int64).reshape(-1, 2), axis=1)
+    edges = edges[edges[:, 0] != edges[:, 1]]
+    keys = np.unique(edges[:, 0] * num_routers + edges[:, 1])
+    return np.stack([keys // num_routers, keys % num_routers], axis=1)
+
+
+def random_tree_edges(num_routers, rng=np.random):
+    """A random spanning tree: routers join in a random order (router 0
+    first), each linked to a uniformly chosen router that joined before it.
+    """
+    order = np.concatenate([[0], 1 + rng.permutation(num_routers - 1)]).astype(
+        np.int64
+    )
+    earlier = rng.rand(num_routers - 1) * np.arange(1, num_routers)
+    parents = order[earlier.astype(np.int64)]
+    return np.stack([order[1:], parents], axis=1)
+
+
+def pair_edges(num_routers, k):
+    """The k-th pairs (i, j), i < j, counting row by row."""
+    n = num_routers
+    k = np.asarray(k, dtype=np.int64)
+
+    def first(i):
+        return i * (2 * n - i - 1) // 2
+
+    # Row i starts at pair first(i); invert that, then fix up rows that
+    # floating-point rounding put one off.
+    i = np.floor((2 * n - 1 - np.sqrt((2 * n - 1) ** 2 - 8.0 * k)) / 2).astype(
+        np.int64
+    )
+    i = np.clip(i, 0, n - 2)
+    i -= (first(i) > k).astype(np.int64)
+    i += (first(i + 1) <= k).astype(np.int64)
+    return np.stack([i, k - first(i) + i + 1], axis=1)
+
+
+def random_pair_edges(num_routers, p, rng=np.random):
+    """Each pair of routers, independently with probability p. Rather than
+    flip a coin per pair, draw the (geometric) gaps between chosen pairs, so
+    time and memory are linear in the number of edges.
+    """
+    pairs = num_routers * (num_routers - 1) // 2
+    if pairs == 0 or p <= 0:
+        return no_edges()
+    if p >= 1:
+        return pair_edges(num_routers, np.arange(pairs))
+    chosen = []
+    last = -1
+    while last < pairs:
+        gaps = rng.geometric(p, int((pairs - last) * p * 1.1) + 16)
+        k = last + np.cumsum(gaps)
+        chosen.append(k[k < pairs])
+        last = k[-1]
+    return pair_edges(num_routers, np.concatenate(chosen))
+
+
+def create_random_topology(num_routers, sparsity=0.15, rng=np.random):
+    """A random spanning tree, so the routers are connected, plus each other
+    pair of routers with probability `sparsity`.
+    """
+    tree = random_tree_edges(num_routers, rng)
+    extra = random_pair_edges(num_routers, sparsity or 0, rng)
+    print("number of edges in tree", len(tree))
+    print("number of sparse edges", len(extra))
+    return num_routers, normalize_edges(
+        num_routers, np.concatenate([tree, extra])
+    )
+
+
+def create_single_switch_topology(num_routers):
+    return 1, no_edges()
+
+
+def create_star_topology(num_routers):
+    """Every router is connect by a single central router"""
+    center = num_routers
+    routers = np.arange(num_routers, dtype=np.int64)
+    return (
+        num_routers + 1,
+        np.stack([routers, np.full_like(routers, center)], axis=1),
+    )
+
+
+def create_chain_topology(num_routers):
+    routers = np.arange(1, num_routers, dtype=np.int64)
+    return num_routers, np.stack([routers - 1, routers], axis=1)
+
+
+def create_ring_topology(num_routers):
+    pass
+
+
+def create_bottleneck_topology(num_routers):
+    """
+    h0            h5
+    h1 s0  s2  s3 h6
+    h2 s1      s4 h7
+    h3            h8
+    """
+    pass
+
+
+def create_topology(topology, num_routers, sparsity=None, rng=np.random):
+    if topology == "single_switch":
+        return create_single_switch_topology(1)
+    elif topology == "star":
+        return create_star_topology(num_routers)
+    elif topology == "chain":
+        return create_chain_topology(num_routers)
+    elif topology == "random":
+        return create_random_topology(num_routers, sparsity, rng)
+    raise NotImplementedError(topology)
+
+
+def host_counts(topology, num_routers, nodes_per_router, num_switches):
+    """The number of hosts attached to each router."""
+    if topology == "single_switch":
+        return [num_routers * nodes_per_router]
+    # The star's central router has no hosts.
+    return [
+        nodes_per_router if j < num_routers else 0 for j in range(num_switches)
+    ]
+
+
+def create_spec(topology, num_routers, nodes_per_router, sparsity, seed=None):
+    """Generate a topology from `seed` (a random one if None) and return
+    its spec: the parameters, the seed, the number of routers
+    ("num_switches"), the edge list and the hosts of each router.
+    """
+    if seed is None:
+        seed = np.random.randint(2**31 - 1)
+    num_switches, edges = create_topology(
+        topology, num_routers, sparsity, np.random.RandomState(seed)
+    )
+    return collections.OrderedDict(
+        [
+            ("topology", topology),
+            ("num_routers", num_routers),
+            ("nodes_per_router", nodes_per_router),
+            ("sparsity", sparsity),
+            ("seed", int(seed)),
+            ("num_switches", num_switches),
+            (
+                "hosts",
+                host_counts(
+                    topology, num_routers, nodes_per_router, num_switches
+                ),
+            ),
+            ("edges", edges),
+        ]
+    )
+
+
+def save_spec(fn, spec):
+    spec = collections.OrderedDict(spec)
+    spec["edges"] = np.asarray(spec["edges"]).tolist()
+    with open(fn, "w") as f:
+        json.dump(spec, f)
+        f.write("\n")
+
+
+def load_spec(fn):
+    with open(fn) as f:
+        spec = json.load(f, object_pairs_hook=collections.OrderedDict)
+    num_switches = spec["num_switches"]
+    edges = np.array(spec["edges"], dtype=np.int64).reshape(-1, 2)
+    assert len(spec["hosts"]) == num_switches, fn
+    assert ((edges >= 0) & (edges < num_switches)).all(), fn
+    spec["edges"] = normalize_edges(num_switches, edges)
+    return spec
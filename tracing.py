@@ -0,0 +1,108 @@
+"""
+Reassemble hop-by-hop latencies from the packet traces that Click switches
+print when tracing is on (see the trace_sample and trace_filter options of
+ClickSwitch). Each TraceTap prints a line like
+
+    s0.in1: 1603054712.123456789:   42 | 02000000 ...
+
+to the switch's log. The same packet is recognized on every switch by its IP
+and UDP headers, which Click doesn't modify.
+
+$ python tracing.py log/s*.log
+"""
+import argparse
+import collections
+import re
+
+import numpy as np
+
+LINE_RE = re.compile(
+    r"^(?P<label>\S+): (?P<ts>\d+\.\d+): +\d+ \| (?P<data>[0-9a-f ]+)$"
+)
+
+# Hex digits of the Ethernet header, which each hop rewrites.
+ETHER_HEX = 28
+
+Record = collections.namedtuple("Record", ["ts", "label"])
+
+
+def parse(lines):
+    """Yield (packet key, Record) for each trace line."""
+    for line in lines:
+        m = LINE_RE.match(line.strip())
+        if m:
+            key = m.group("data").replace(" ", "")[ETHER_HEX:]
+            yield key, Record(ts=float(m.group("ts")), label=m.group("label"))
+
+
+def collect(filenames):
+    """Return the path of every traced packet: a list of Records sorted by
+    time. Packets with the same headers (e.g. after the IP ID wraps) are
+    split into separate paths when a tap sees the packet twice.
+    """
+    records = collections.defaultdict(list)
+    for fn in filenames:
+        with open(fn) as f:
+            for key, record in parse(f):
+                records[key].append(record)
+    paths = []
+    for key_records in records.values():
+        path = []
+        for record in sorted(key_records):
+            if any(r.label == record.label for r in path):
+                paths.append(path)
+                path = []
+            path.append(record)
+        paths.append(path)
+    return paths
+
+
+def hop_latencies(paths):
+    """Map each (from label, to label) hop to an array of latencies (s). A
+    switch's in -> out hop is time spent in the switch, and its out -> next
+    switch's in hop is time spent queued and on the link.
+    """
+    hops = collections.defaultdict(list)
+    for path in paths:
+        for a, b in zip(path, path[1:]):
+            hops[(a.label, b.label)].append(b.ts - a.ts)
+    return {hop: np.array(latencies) for hop, latencies in hops.items()}
+
+
+def path_latencies(paths):
+    """Latency (s) from the first to the last tap of each multi-tap path."""
+    return np.array([p[-1].ts - p[0].ts for p in paths if len(p) > 1])
+
+
+def summarize(latencies):
+    """Percentiles of an array of latencies, in microseconds."""
+    us = latencies * 1e6
+    return collections.OrderedDict(
+        [
+            ("packets", len(us)),
+            ("p50_us", np.percentile(us, 50) if len(us) else None),
+            ("p99_us", np.percentile(us, 99) if len(us) else None),
+            ("max_us", us.max() if len(us) else None),
+        ]
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("logs", nargs="+")
+    args = parser.parse_args()
+    paths = collect(args.logs)
+    print("hop\tpackets\tp50_us\tp99_us\tmax_us")
+    for hop, latencies in sorted(hop_latencies(paths).items()):
+        print(
+            "\t".join(
+                ["{} -> {}".format(*hop)]
+                + [str(v) for v in summarize(latencies).values()]
+            )
+        )
+    print(
+        "\t".join(
+            ["end to end"]
+            + [str(v) for v in summarize(path_latencies(paths)).values()]
+        )
+    )
@@ -0,0 +1,214 @@
+"""
+Payload format and streaming statistics for traffic/send.py and
+traffic/receive.py: every datagram carries its stream, sequence number and
+send time, from which the receiver keeps a latency histogram and counts
+reordered, duplicate and lost packets in bounded memory.
+"""
+import collections
+import ctypes
+import ctypes.util
+import struct
+
+# Stream id, sequence number and send time (ns, CLOCK_MONOTONIC): 14 bytes,
+# the payload of a 64-byte packet. Mininet hosts share the kernel's
+# monotonic clock, so one-way latencies need no clock sync.
+PAYLOAD = struct.Struct("!HIQ")
+
+CLOCK_MONOTONIC = 1
+
+libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+
+
+class timespec(ctypes.Structure):
+    _fields_ = [("tv_sec", ctypes.c_long), ("tv_nsec", ctypes.c_long)]
+
+
+def monotonic_ns():
+    t = timespec()
+    libc.clock_gettime(CLOCK_MONOTONIC, ctypes.byref(t))
+    return t.tv_sec * 1000000000 + t.tv_nsec
+
+
+class Histogram(object):
+    """Log-linear histogram in the style of HdrHistogram: values below
+    2**sub_bits are counted exactly, larger ones in buckets 1/2**(sub_bits-1)
+    of their power of two wide, so every recorded value is known to within
+    that relative error. Memory is bounded by the number of powers of two.
+    """
+
+    def __init__(self, sub_bits=7):
+        self.sub_bits = sub_bits
+        self.counts = collections.defaultdict(int)
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def bucket(self, value):
+        """Lowest value of the bucket that `value` falls in."""
+        shift = max(0, value.bit_length() - self.sub_bits)
+        return (value >> shift) << shift
+
+    def record(self, value, n=1):
+        value = max(0, int(value))
+        self.counts[self.bucket(value)] += n
+        self.count += n
+        self.total += value * n
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        for bucket, n in other.counts.items():
+            self.counts[bucket] += n
+        self.count += other.count
+        self.total += other.total
+        for v in (other.min, other.max):
+            if v is not None:
+                self.min = v if self.min is None else min(self.min, v)
+                self.max = v if self.max is None else max(self.max, v)
+
+    def percentile(self, q):
+        """The bucket holding the q-th percentile (0 < q <= 100)."""
+        if not self.count:
+            return None
+        rank = q / 100.0 * self.count
+        seen = 0
+        for bucket in sorted(self.counts):
+            seen += self.counts[bucket]
+            if seen >= rank:
+                return bucket
+        return self.max
+
+    def summary(self, scale=1.0):
+        """Count, mean, min, percentiles and max, divided by `scale`."""
+        out = collections.OrderedDict([("count", self.count)])
+        if not self.count:
+            return out
+        out["mean"] = self.total / float(self.count) / scale
+        out["min"] = self.min / scale
+        for q in (50, 90, 99, 99.9):
+            out["p{}".format(str(q).replace(".", ""))] = (
+                self.percentile(q) / scale
+            )
+        out["max"] = self.max / scale
+        return out
+
+
+class SequenceTracker(object):
+    """Follows one stream's sequence numbers. Numbers within `window` of the
+    highest seen are remembered, to tell reordered packets from duplicates;
+    a number that leaves the window without being seen is lost, and
+    consecutive lost numbers make a loss burst.
+    """
+
+    def __init__(self, window=4096):
+        self.window = window
+        self.highest = None
+        self.seen = set()
+        self.received = 0
+        self.reordered = 0
+        self.max_reorder = 0
+        self.duplicates = 0
+        self.late = 0
+        self.lost = 0
+        self.bursts = collections.defaultdict(int)
+        self._burst = 0
+        self._expired = None
+
+    def add(self, seq):
+        if self.highest is None:
+            self.highest = self._expired = seq - 1
+        if seq > self.highest:
+            self.highest = seq
+            self.seen.add(seq)
+            self.received += 1
+            self._expire(seq - self.window)
+        elif seq <= self._expired:
+            # Too old to tell whether it's a duplicate.
+            self.late += 1
+        elif seq in self.seen:
+            self.duplicates += 1
+        else:
+            self.seen.add(seq)
+            self.received += 1
+            self.reordered += 1
+            self.max_reorder = max(self.max_reorder, self.highest - seq)
+
+    def _expire(self, upto):
+        """Settle the sequence numbers up to `upto`: lost if not seen."""
+        for seq in range(self._expired + 1, upto + 1):
+            if seq in self.seen:
+                self.seen.discard(seq)
+                self._end_burst()
+            else:
+                self.lost += 1
+                self._burst += 1
+        self._expired = max(self._expired, upto)
+
+    def _end_burst(self):
+        if self._burst:
+            self.bursts[self._burst] += 1
+            self._burst = 0
+
+    def finish(self):
+        """Settle every sequence number seen so far; packets after the
+        highest one that never arrived can't be told apart from ones not
+        sent, so they aren't counted as lost.
+        """
+        if self.highest is not None:
+            self._expire(self.highest)
+            self._end_burst()
+
+
+class StreamStats(object):
+    """Latency, jitter and sequence statistics over every stream a receiver
+    sees.
+    """
+
+    def __init__(self):
+        self.latency = Histogram()
+        self.streams = {}
+        # RFC 3550 interarrival jitter (ns), per stream.
+        self.jitter = {}
+        self._transit = {}
+
+    def add(self, stream, seq, sent_ns, now_ns):
+        transit = now_ns - sent_ns
+        self.latency.record(transit)
+        if stream not in self.streams:
+            self.streams[stream] = SequenceTracker()
+            self.jitter[stream] = 0.0
+        else:
+            d = abs(transit - self._transit[stream])
+            self.jitter[stream] += (d - self.jitter[stream]) / 16.0
+        self._transit[stream] = transit
+        self.streams[stream].add(seq)
+
+    def summary(self):
+        for tracker in self.streams.values():
+            tracker.finish()
+        trackers = list(self.streams.values())
+        bursts = collections.defaultdict(int)
+        for tracker in trackers:
+            for length, n in tracker.bursts.items():
+                bursts[length] += n
+        return collections.OrderedDict(
+            [
+                ("streams", len(trackers)),
+                ("latency_us", self.latency.summary(scale=1000.0)),
+                # The worst stream's jitter.
+                (
+                    "jitter_us",
+                    max(self.jitter.values()) / 1000.0 if self.jitter else None,
+                ),
+                ("reordered", sum(t.reordered for t in trackers)),
+                ("max_reorder", max([t.max_reorder for t in trackers] or [0])),
+                ("duplicates", sum(t.duplicates for t in trackers)),
+                ("late", sum(t.late for t in trackers)),
+                ("lost", sum(t.lost for t in trackers)),
+                ("loss_bursts", sum(bursts.values())),
+                ("max_loss_burst", max(list(bursts) or [0])),
+            ]
+        )
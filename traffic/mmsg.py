@@ -0,0 +1,199 @@
+"""
+Batched UDP sends and receives with Linux's sendmmsg(2) and recvmmsg(2): one
+system call moves a whole burst of datagrams to or from a preallocated
+buffer. Falls back to one sendto or recv per datagram where libc has no
+sendmmsg or recvmmsg.
+"""
+import ctypes
+import ctypes.util
+import errno
+import os
+import socket
+import struct
+
+libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+try:
+    _sendmmsg = libc.sendmmsg
+except AttributeError:
+    _sendmmsg = None
+try:
+    _recvmmsg = libc.recvmmsg
+except AttributeError:
+    _recvmmsg = None
+
+# recvmmsg flag: block for the first datagram only, then take what's queued.
+MSG_WAITFORONE = 0x10000
+# Like SO_RCVBUF, but not capped by net.core.rmem_max (needs CAP_NET_ADMIN).
+SO_RCVBUFFORCE = 33
+
+
+class iovec(ctypes.Structure):
+    _fields_ = [("iov_base", ctypes.c_void_p), ("iov_len", ctypes.c_size_t)]
+
+
+class msghdr(ctypes.Structure):
+    _fields_ = [
+        ("msg_name", ctypes.c_void_p),
+        ("msg_namelen", ctypes.c_uint32),
+        ("msg_iov", ctypes.POINTER(iovec)),
+        ("msg_iovlen", ctypes.c_size_t),
+        ("msg_control", ctypes.c_void_p),
+        ("msg_controllen", ctypes.c_size_t),
+        ("msg_flags", ctypes.c_int),
+    ]
+
+
+class mmsghdr(ctypes.Structure):
+    _fields_ = [("msg_hdr", msghdr), ("msg_len", ctypes.c_uint)]
+
+
+# Errors that mean the datagrams weren't sent this time, e.g. a full socket
+# buffer or an ICMP error for an earlier datagram, rather than a bad socket.
+TRANSIENT_ERRORS = (errno.EAGAIN, errno.ENOBUFS, errno.ECONNREFUSED)
+
+
+def sockaddr_in(ip, port):
+    return ctypes.create_string_buffer(
+        struct.pack("=H", socket.AF_INET)
+        + struct.pack("!H", port)
+        + socket.inet_aton(ip)
+        + b"\0" * 8,
+        16,
+    )
+
+
+class SendBatch(object):
+    """Sends bursts of up to `burst` datagrams of `size` bytes to (ip, port).
+    Datagram i of a burst is bytes [i * size, (i + 1) * size) of `buf`,
+    which can be rewritten between sends.
+    """
+
+    def __init__(self, sock, ip, port, size, burst):
+        self.sock = sock
+        self.dst = (ip, port)
+        self.size = size
+        self.burst = burst
+        self.buf = ctypes.create_string_buffer(size * burst)
+        self.addr = sockaddr_in(ip, port)
+        self.iov = (iovec * burst)()
+        self.msgs = (mmsghdr * burst)()
+        base = ctypes.addressof(self.buf)
+        for i in range(burst):
+            self.iov[i].iov_base = base + i * size
+            self.iov[i].iov_len = size
+            hdr = self.msgs[i].msg_hdr
+            hdr.msg_name = ctypes.addressof(self.addr)
+            hdr.msg_namelen = ctypes.sizeof(self.addr)
+            hdr.msg_iov = ctypes.pointer(self.iov[i])
+            hdr.msg_iovlen = 1
+
+    def send(self, n):
+        """Send the first n datagrams; returns how many were sent."""
+        if _sendmmsg is None:
+            return self._sendto(n)
+        sent = _sendmmsg(self.sock.fileno(), self.msgs, n, 0)
+        if sent < 0:
+            err = ctypes.get_errno()
+            if err in TRANSIENT_ERRORS:
+                return 0
+            raise OSError(err, os.strerror(err))
+        return sent
+
+    def _sendto(self, n):
+        for i in range(n):
+            try:
+                self.sock.sendto(
+                    self.buf.raw[i * self.size : (i + 1) * self.size], self.dst
+                )
+            except socket.error as e:
+                if e.errno in TRANSIENT_ERRORS:
+                    return i
+                raise
+        return n
+
+
+class RecvBatch(object):
+    """Receives up to `burst` datagrams per call into a preallocated buffer:
+    datagram i lands at bytes [i * size, i * size + lengths[i]) of `buf`
+    (longer datagrams are truncated to `size`).
+    """
+
+    def __init__(self, sock, size, burst):
+        self.sock = sock
+        self.size = size
+        self.burst = burst
+        self.buf = ctypes.create_string_buffer(size * burst)
+        self.iov = (iovec * burst)()
+        self.msgs = (mmsghdr * burst)()
+        self.lengths = [0] * burst
+        base = ctypes.addressof(self.buf)
+        for i in range(burst):
+            self.iov[i].iov_base = base + i * size
+            self.iov[i].iov_len = size
+            self.msgs[i].msg_hdr.msg_iov = ctypes.pointer(self.iov[i])
+            self.msgs[i].msg_hdr.msg_iovlen = 1
+
+    def recv(self):
+        """Wait for datagrams (up to the socket's receive timeout) and
+        return how many were received, 0 on timeout.
+        """
+        if _recvmmsg is None:
+            return self._recv()
+        n = _recvmmsg(
+            self.sock.fileno(), self.msgs, self.burst, MSG_WAITFORONE, None
+        )
+        if n < 0:
+            err = ctypes.get_errno()
+            if err in (errno.EAGAIN, errno.EINTR):
+                return 0
+            raise OSError(err, os.strerror(err))
+        for i in range(n):
+            self.lengths[i] = self.msgs[i].msg_len
+        return n
+
+    def _recv(self):
+        view = memoryview(self.buf)
+        try:
+            self.lengths[0] = self.sock.recv_into(view[: self.size])
+        except socket.error as e:
+            if e.errno in (errno.EAGAIN, errno.EINTR):
+                return 0
+            raise
+        return 1
+
+
+def set_recv_timeout(sock, seconds):
+    """Make blocking receives on sock give up after `seconds`."""
+    sec = int(seconds)
+    sock.setsockopt(
+        socket.SOL_SOCKET,
+        socket.SO_RCVTIMEO,
+        struct.pack("ll", sec, int((seconds - sec) * 1e6)),
+    )
+
+
+def set_rcvbuf(sock, size):
+    """Set the socket's receive buffer to `size` bytes, beyond rmem_max if
+    allowed. Returns the size the kernel reports (twice what was asked, for
+    bookkeeping overhead).
+    """
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, SO_RCVBUFFORCE, size)
+    except socket.error:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, size)
+    return sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+
+
+def socket_drops(sock, proc_file="/proc/net/udp"):
+    """Datagrams the kernel dropped for sock, e.g. because its receive
+    buffer was full, or None if it isn't listed.
+    """
+    inode = str(os.fstat(sock.fileno()).st_ino)
+    with open(proc_file) as f:
+        # Columns: sl local_address rem_address st tx_queue:rx_queue tr
+        # tm->when retrnsmt uid timeout inode ref pointer drops
+        for line in f.readlines()[1:]:
+            fields = line.split()
+            if len(fields) >= 13 and fields[9] == inode:
+                return int(fields[-1])
+    return None
@@ -3,12 +3,22 @@ import argparse
 import collections
 import fpformat
 import json
-from multiprocessing import Process, Value
+from multiprocessing import Pipe, Process, RawArray
 from pprint import pprint
 import socket
 import sys
 import time
 
+import measure
+import mmsg
+
+# How often (s) the listener publishes its socket drops, and the longest it
+# blocks waiting for packets.
+PUBLISH_INTERVAL = 0.1
+
+# Slots of the shared array the listener publishes to.
+RECEIVED, SOCKET_DROPS, RCVBUF = range(3)
+
 
 def parse_args():
     parser = argparse.ArgumentParser()
@@ -16,26 +26,105 @@ def parse_args():
     parser.add_argument("--port", type=int, default=5005)
     parser.add_argument("--ttl", help="ttl in seconds", type=int, default=5)
     parser.add_argument("--size", type=int, default=64)
+    parser.add_argument(
+        "--burst", help="packets per recvmmsg call", type=int, default=64
+    )
+    parser.add_argument(
+        "--rcvbuf",
+        help="socket receive buffer in bytes",
+        type=int,
+        default=8 * 1024 * 1024,
+    )
+    parser.add_argument(
+        "--interval",
+        help="seconds between progress records",
+        type=float,
+        default=0.1,
+    )
+    parser.add_argument(
+        "--count_only",
+        action="store_true",
+        help="only count packets, without latency and sequence statistics",
+    )
     parser.add_argument("--log", default="/dev/null")
     return parser.parse_args()
 
 
-def listen(args, count):
+def listen(args, stats, conn):
+    """Count packets until args.ttl is up. Counts are kept locally and
+    written to the shared `stats` after each batch (socket drops every
+    PUBLISH_INTERVAL), without a lock: only this process writes them.
+    Latency and sequence statistics (see measure.StreamStats) are sent over
+    `conn` at the end.
+    """
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    stats[RCVBUF] = mmsg.set_rcvbuf(sock, args.rcvbuf)
+    mmsg.set_recv_timeout(sock, PUBLISH_INTERVAL)
     sock.bind((args.ip, args.port))
+    batch = mmsg.RecvBatch(sock, args.size, args.burst)
+    streams = None if args.count_only else measure.StreamStats()
+    count = 0
+    end_at = time.time() + args.ttl
+    publish_at = 0
     while True:
-        msg, _ = sock.recvfrom(args.size)
-        count.value += 1
+        n = batch.recv()
+        count += n
+        if n and streams:
+            # Latency is measured to when the batch is read, so it includes
+            # time spent queued at the socket.
+            now_ns = measure.monotonic_ns()
+            for i in range(n):
+                if batch.lengths[i] >= measure.PAYLOAD.size:
+                    stream, seq, sent_ns = measure.PAYLOAD.unpack_from(
+                        batch.buf, i * args.size
+                    )
+                    streams.add(stream, seq, sent_ns, now_ns)
+        stats[RECEIVED] = count
+        now = time.time()
+        if now >= publish_at or now >= end_at:
+            stats[SOCKET_DROPS] = mmsg.socket_drops(sock) or 0
+            publish_at = now + PUBLISH_INTERVAL
+        if now >= end_at:
+            break
+    conn.send(streams.summary() if streams else None)
 
 
 def receive(args):
-    count = Value("i", 0)
-    p = Process(target=listen, args=(args, count))
+    stats = RawArray("d", 3)
+    recv_conn, send_conn = Pipe(duplex=False)
+    p = Process(target=listen, args=(args, stats, send_conn))
     p.start()
-    p.join(args.ttl)
-    print("%d" % count.value)
+    # Stream the counts so far every interval until the listener stops and
+    # sends its statistics, then the summary.
+    end_at = time.time() + args.ttl + 1
+    while not recv_conn.poll(args.interval) and time.time() < end_at:
+        print(
+            json.dumps(
+                {
+                    "time": time.time(),
+                    "received": int(stats[RECEIVED]),
+                    "socket_drops": int(stats[SOCKET_DROPS]),
+                }
+            )
+        )
+        sys.stdout.flush()
+    summary = recv_conn.recv() if recv_conn.poll(0) else None
+    p.join(1)
+    if p.is_alive():
+        p.terminate()
+    # Packets the kernel dropped because the socket's buffer was full never
+    # reached the receiver, but weren't lost in the network either.
+    result = {
+        "received": int(stats[RECEIVED]),
+        "socket_drops": int(stats[SOCKET_DROPS]),
+        "rcvbuf": int(stats[RCVBUF]),
+    }
+    if summary:
+        result.update(summary)
+    result = json.dumps(result, sort_keys=True)
+    print(result)
     with open(args.log, "w") as f:
-        f.write("%d\n" % count.value)
+        f.write(result + "\n")
 
 
 if __name__ == "__main__":
@@ -1,11 +1,15 @@
 """Send UDP packets. https://wiki.python.org/moin/UdpCommunication"""
 import argparse
 import fpformat
+import json
+from multiprocessing import Process, RawArray
 import socket
-import struct
 import sys
 import time
 
+import measure
+import mmsg
+
 
 def parse_args():
     parser = argparse.ArgumentParser()
@@ -13,30 +17,112 @@ def parse_args():
     parser.add_argument("--port", type=int, default=5005)
     parser.add_argument("--size", type=int, default=64)
     parser.add_argument("--ttl", help="ttl in seconds", type=int, default=5)
-    parser.add_argument("--rate", help="kpackets/sec", type=int, default=0)
+    parser.add_argument("--rate", help="kpackets/sec", type=float, default=0)
+    parser.add_argument(
+        "--burst", help="packets per sendmmsg call", type=int, default=32
+    )
+    parser.add_argument(
+        "--procs",
+        help="sender processes, each sending rate/procs",
+        type=int,
+        default=1,
+    )
+    parser.add_argument(
+        "--interval",
+        help="seconds between progress records",
+        type=float,
+        default=0.1,
+    )
+    parser.add_argument(
+        "--stream",
+        help="this sender's index; each process sends stream "
+        "stream * procs + process",
+        type=int,
+        default=0,
+    )
     parser.add_argument("--log", default="/dev/null")
     return parser.parse_args()
 
 
-def send(args):
+def send_loop(args, rate, proc, sent, elapsed):
+    """Send bursts at `rate` packets/sec (0 for as fast as possible) for
+    args.ttl seconds, publishing the count sent and the time taken in
+    sent[proc] and elapsed[proc].
+    """
     # From Kohler et al: "Each 64-byte UDP packet includes Ethernet,
     # IP, and UDP headers as well as 14 bytes of data and the 4-byte
-    # Ethernet CRC." So create a 14-byte message which should get
-    # padded into a 64 byte packet.
-    msg = struct.pack("c" * 14, *["x" for _ in xrange(14)])
-    count = 0
-    end_at = time.time() + args.ttl
-    tick = (1.0 / (args.rate * 1000)) if args.rate > 0 else 0.0
+    # Ethernet CRC." So send a 14-byte message which should get padded
+    # into a 64 byte packet: the stream, sequence number and send time
+    # (see measure.PAYLOAD).
+    size = measure.PAYLOAD.size
+    stream = args.stream * max(1, args.procs) + proc
+    seq = 0
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    while time.time() < end_at:
-        next_tick = time.time() + tick
-        sock.sendto(msg, (args.ip, args.port))
-        count += 1
-        while time.time() < next_tick:
-            continue
-    print("%d" % count)
+    batch = mmsg.SendBatch(sock, args.ip, args.port, size, args.burst)
+    count = 0
+    start = time.time()
+    end_at = start + args.ttl
+    while True:
+        now = time.time()
+        if now >= end_at:
+            break
+        if rate > 0:
+            # Pace against an absolute schedule: the next burst is due once
+            # the packets sent so far are what `rate` allows, so time lost
+            # oversleeping (or to partial sends) is made up, not lost.
+            due = start + count / rate
+            if now < due:
+                time.sleep(min(due - now, end_at - now))
+                continue
+        # Every packet of a burst gets the same send time.
+        sent_ns = measure.monotonic_ns()
+        for i in range(args.burst):
+            measure.PAYLOAD.pack_into(
+                batch.buf, i * size, stream, (seq + i) & 0xFFFFFFFF, sent_ns
+            )
+        n = batch.send(args.burst)
+        seq += n
+        count += n
+        sent[proc] = count
+    elapsed[proc] = time.time() - start
+
+
+def send(args):
+    procs = max(1, args.procs)
+    # Stream ids are 16 bits (see measure.PAYLOAD).
+    assert (args.stream + 1) * procs <= 0x10000, "too many streams"
+    sent = RawArray("d", procs)
+    elapsed = RawArray("d", procs)
+    rate = args.rate * 1000.0 / procs
+    ps = [
+        Process(target=send_loop, args=(args, rate, i, sent, elapsed))
+        for i in range(procs)
+    ]
+    for p in ps:
+        p.start()
+    # Stream the total sent so far every interval, then the summary.
+    while any(p.is_alive() for p in ps):
+        time.sleep(args.interval)
+        print(json.dumps({"time": time.time(), "sent": int(sum(sent))}))
+        sys.stdout.flush()
+    for p in ps:
+        p.join()
+    count = int(sum(sent))
+    seconds = max(elapsed) or float(args.ttl)
+    # The achieved rate is reported alongside the offered one, so a sender
+    # that can't keep up is visible.
+    result = json.dumps(
+        {
+            "sent": count,
+            "seconds": seconds,
+            "rate": count / seconds / 1000.0,
+            "offered": args.rate,
+        },
+        sort_keys=True,
+    )
+    print(result)
     with open(args.log, "w") as f:
-        f.write("%d\n" % count)
+        f.write(result + "\n")
 
 
 if __name__ == "__main__":